@@ -0,0 +1,107 @@
+"""
+Consumer model input encoding: the previous pandas get_dummies / concat /
+reindex path vs ConsumerFeatureEncoder.encode / encode_batch. Checks that
+both give bit-identical float64 arrays first: known and unknown markets,
+int and float IR/LOI, the live feature list and reordered / partial ones.
+
+    python benchmarks/bench_feature_encoder.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "predictcpi.settings")
+
+import django
+
+django.setup()
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from predictcpi.views.features import ConsumerFeatureEncoder
+
+FEATURES_FILE = os.path.join("ml", "consumer_pricing_features.pkl")
+FALLBACK_FEATURES = ["market_INTERNATIONAL", "market_USA", "incidence_rate", "loi_minutes"]
+
+
+def encode_pandas(markets, irs, lois, features):
+    """The pre-encoder path from PredictCPI, for many rows at once."""
+    market_df = pd.get_dummies(pd.Series(markets), prefix='market')
+    numeric_df = pd.DataFrame({'incidence_rate': irs, 'loi_minutes': lois})
+    encoded = pd.concat(
+        [market_df.reset_index(drop=True), numeric_df.reset_index(drop=True)],
+        axis=1
+    ).reindex(columns=features, fill_value=0)
+    return encoded.to_numpy(dtype=np.float64)
+
+
+def feature_lists(rnd):
+    try:
+        live = list(joblib.load(FEATURES_FILE))
+    except FileNotFoundError:
+        live = list(FALLBACK_FEATURES)
+    shuffled = live[:]
+    rnd.shuffle(shuffled)
+    numeric_first = [f for f in live if not f.startswith("market_")] + [f for f in live if f.startswith("market_")]
+    return {
+        "live": live,
+        "shuffled": shuffled,
+        "numeric_first": numeric_first,
+        "no_loi": [f for f in live if f != "loi_minutes"],
+        "markets_only": [f for f in live if f.startswith("market_")],
+        "extra_column": live + ["market_MARS", "device_mobile"],
+    }
+
+
+def sample_inputs(features, rnd, n=500):
+    known = [f[len('market_'):] for f in features if f.startswith('market_')]
+    markets = known + ["UNKNOWN", "", "usa"]
+    values = [1, 5, 50, 100, 120, 0, 7.5, 0.25, 33.333333333333336, 99.99, 1e-3]
+    return (
+        [rnd.choice(markets) for _ in range(n)],
+        [rnd.choice(values) for _ in range(n)],
+        [rnd.choice(values) for _ in range(n)],
+    )
+
+
+def same_bits(a, b):
+    return a.dtype == b.dtype and a.shape == b.shape and a.tobytes() == b.tobytes()
+
+
+def check_parity(seed=0):
+    rnd = random.Random(seed)
+    rows = 0
+    for name, features in feature_lists(rnd).items():
+        encoder = ConsumerFeatureEncoder(features)
+        markets, irs, lois = sample_inputs(features, rnd)
+        expected = encode_pandas(markets, irs, lois, features)
+
+        # a dirty, oversized buffer must come back exactly as a fresh one
+        out = np.full((len(markets) + 7, len(features)), 3.0)
+        for batch in (encoder.encode_batch(markets, irs, lois), encoder.encode_batch(markets, irs, lois, out=out)):
+            assert same_bits(batch, expected), f"encode_batch differs for feature list {name!r}"
+
+        for i, (m, ir, loi) in enumerate(zip(markets, irs, lois)):
+            row = encoder.encode(m, ir, loi)
+            assert same_bits(row, encode_pandas([m], [ir], [loi], features)), (name, m, ir, loi)
+            assert same_bits(row[0], expected[i]), (name, m, ir, loi)
+        rows += len(markets)
+    return rows
+
+
+def main(number=5_000):
+    print(f"parity ok on {check_parity()} rows")
+    features = feature_lists(random.Random(0))["live"]
+    encoder = ConsumerFeatureEncoder(features)
+    market = next((f[len('market_'):] for f in features if f.startswith('market_')), "USA")
+    before = timeit.timeit(lambda: encode_pandas([market], [50], [10], features), number=number) / number * 1e6
+    after = timeit.timeit(lambda: encoder.encode(market, 50, 10), number=number) / number * 1e6
+    print(f"one row: pandas {before:.1f} us, encoder {after:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+find_region: per-country regex loop (previous implementation) vs the
+precompiled single-pass matcher.
+
+    python benchmarks/bench_find_region.py
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "predictcpi.settings")
+
+import django
+
+django.setup()
+
+from predictcpi.views.countries import countries
+from predictcpi.views.training import find_region
+
+
+def find_region_loop(text: str) -> str:
+    text_upper = text.upper()
+    for keyword in ["MENA", "APAC", "EU", "USA", "CANADA", "UK", "LATAM"]:
+        if re.search(r'\b' + re.escape(keyword) + r'\b', text_upper):
+            return "LATAM America" if keyword == "LATAM" else keyword
+    for code, data in countries.items():
+        country_name_upper = data["name"].upper()
+        if re.search(r'\b' + re.escape(code) + r'\b', text_upper) or re.search(r'\b' + re.escape(country_name_upper) + r'\b', text_upper):
+            region = data["region"]
+            return "LATAM America" if region == "LATAM" else region
+    return "Unknown"
+
+
+SAMPLES = [
+    "USA", "INDIA", "GERMANY", "LATAM", "ZIMBABWE", "VIET NAM",
+    "FRANCE, SPAIN AND ITALY", "SOMEWHERE ELSE", "UNITED ARAB EMIRATES",
+    "NEW ZEALAND / AUSTRALIA",
+]
+
+
+def main(number=200):
+    for text in SAMPLES:
+        assert find_region(text) == find_region_loop(text), text
+
+    print(f"{'input':<28} {'loop us':>10} {'matcher us':>11} {'speedup':>8}")
+    for text in SAMPLES:
+        before = timeit.timeit(lambda: find_region_loop(text), number=number) / number * 1e6
+        after = timeit.timeit(lambda: find_region(text), number=number) / number * 1e6
+        print(f"{text:<28} {before:>10.1f} {after:>11.1f} {before / after:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
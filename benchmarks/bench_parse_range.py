@@ -0,0 +1,88 @@
+"""
+IR/LOI range parsing: previous regex chain vs the compiled tokenizer,
+cold (cache cleared) and warm (memoized). Checks parity on the docstring
+formats and on randomized inputs first.
+
+    python benchmarks/bench_parse_range.py
+"""
+import os
+import random
+import re
+import sys
+import timeit
+from math import ceil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "predictcpi.settings")
+
+import django
+
+django.setup()
+
+from predictcpi.views.training import _parse_range, _parse_range_text
+
+
+def parse_range_regex(val):
+    if val is None:
+        return None
+    s = str(val).lower().strip()
+    s = s.replace("–", "-").replace("—", "-")
+    s_clean = re.sub(r"(percent|%|ir|loi|minutes|minute|mins|min)", "", s)
+    s_clean = s_clean.replace("to", "-")
+    s_clean = re.sub(r"[^0-9\.\-\s]", " ", s_clean)
+    s_clean = re.sub(r"\s+", " ", s_clean).strip()
+    nums = re.findall(r"\d+\.?\d*", s_clean)
+    if "-" in s_clean and len(nums) >= 2:
+        a = float(nums[0]); b = float(nums[1])
+        return (int(ceil(min(a, b))), int(ceil(max(a, b))))
+    if nums:
+        iv = int(ceil(float(nums[0])))
+        return (iv, iv)
+    return None
+
+
+FORMATS = [
+    "ir- 5-9%", "5–9%", "5—9%", "5 to 9", "5 - 9", "8.5-12.2",
+    "10-15 min", "5%", "20", "LOI: 12 mins", "25 minutes", "IR 30 percent",
+]
+
+FUZZ_TOKENS = [
+    "ir", "loi", "IR", "LOI", "%", "percent", "min", "mins", "minute", "minutes", "to",
+    "-", "–", "—", " ", "  ", ":", ".", ",", "+", "t", "o", "i", "r", "m", "n", "~", "٥", "\t",
+    "0", "1", "5", "9", "10", "12.5", "99", "3.", ".7",
+]
+
+
+def _outcome(fn, val):
+    try:
+        return fn(val)
+    except Exception as e:  # e.g. OverflowError on absurdly long numbers
+        return type(e).__name__
+
+
+def check_parity(rounds=200_000, seed=0):
+    rnd = random.Random(seed)
+    cases = FORMATS + [None, 5, 7.25, "", "abc"]
+    for _ in range(rounds):
+        cases.append("".join(rnd.choice(FUZZ_TOKENS) for _ in range(rnd.randint(1, 8))))
+    for val in cases:
+        assert _outcome(_parse_range, val) == _outcome(parse_range_regex, val), repr(val)
+    return len(cases)
+
+
+def main(number=20_000):
+    print(f"parity ok on {check_parity()} inputs")
+    print(f"{'input':<16} {'regex us':>9} {'cold us':>8} {'warm us':>8}")
+    for text in FORMATS:
+        before = timeit.timeit(lambda: parse_range_regex(text), number=number) / number * 1e6
+
+        def cold():
+            _parse_range_text.cache_clear()
+            _parse_range(text)
+        cold_us = timeit.timeit(cold, number=number) / number * 1e6
+        warm = timeit.timeit(lambda: _parse_range(text), number=number) / number * 1e6
+        print(f"{text:<16} {before:>9.2f} {cold_us:>8.2f} {warm:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
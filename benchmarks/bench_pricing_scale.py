@@ -0,0 +1,331 @@
+"""
+Pricing engine at synthetic scale: the live rate cards (qlab_b2b_pricing,
+the two Acuity tables, survey_pricing clients, consumer_pricing) grown to
+1x, 100x and 10,000x today's size, each scale built and measured in a fresh
+forked process.
+
+  - b2b / Acuity: every country's bands repeated `scale` times, copy k
+    shifted k * span minutes up the LOI axis, so each country's band index
+    is `scale` times longer and queries in today's LOI/IR range still match.
+  - clients: today's clients plus random synthetic names up to `scale` x.
+  - consumer: lookup and grid extended along the IR/LOI bucket axes (same
+    bucket step) to ~`scale` x the cells; queries are drawn over the grown
+    domain so the exact / model mix stays comparable between scales.
+
+b2b_find_price, acuity_b2b_find_price and b2b_with_client_find_price are
+called directly on the snapshot; the consumer path goes end-to-end through
+PredictCPI (DRF request parsing included) with the quote cache disabled.
+Reports p50/p99 latency, single-thread throughput, snapshot build time and
+memory (RSS added by the snapshot, peak RSS) to a JSON file; `--compare`
+prints the change against an earlier run.
+
+    python benchmarks/bench_pricing_scale.py [--scales 1,100,10000] [--out FILE] [--compare BASE.json]
+
+Default output: benchmarks/results/pricing_scale-<commit>.json.
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import string
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "predictcpi.settings")
+# typo tolerance is opt-in in the API; on here so the [typo] case measures the fuzzy lookup
+os.environ.setdefault("CLIENT_NAME_MAX_TYPOS", "2")
+
+import django
+
+django.setup()
+
+import numpy as np
+from rest_framework.test import APIRequestFactory
+
+from predictcpi.views.artifacts import read_bundle
+from predictcpi.views.training import (
+    ARTIFACT_FILES, ARTIFACT_ROOT, PredictCPI, PricingSnapshot, acuity_b2b_find_price,
+    b2b_find_price, b2b_with_client_find_price, pricing_registry, quote_cache,
+)
+
+SCALES = (1, 100, 10000)
+QUERIES = 1000
+WARMUP = 50
+MIN_CALLS = 20          # per function, even when a single call is slow
+MAX_CALLS = 5000
+TIME_BUDGET = 2.0       # seconds per function once MIN_CALLS are done
+SEED = 7
+
+
+# ---------------- Synthetic rate cards ----------------
+def tiled_bands(rows, scale):
+    """Band rows repeated `scale` times per country, copy k shifted k * span up the LOI axis."""
+    span = max(r["loi_max"] for r in rows) + 1
+    for k in range(scale):
+        for r in rows:
+            yield {**r, "loi_min": r["loi_min"] + k * span, "loi_max": r["loi_max"] + k * span}
+
+
+def random_name(rng):
+    words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+             for _ in range(rng.randint(1, 3))]
+    return " ".join(words)
+
+
+def synthetic_clients(records, scale, rng):
+    clients = list(records)
+    names = {r["client_name"] for r in clients}
+    while len(clients) < len(records) * scale:
+        name = random_name(rng)
+        if name in names:
+            continue
+        names.add(name)
+        template = records[len(clients) % len(records)]
+        clients.append({**template, "client_name": name})
+    return clients
+
+
+def _extend_buckets(buckets, n):
+    step = buckets[-1] - buckets[-2]
+    return list(buckets) + [buckets[-1] + step * (k + 1) for k in range(n - len(buckets))]
+
+
+def synthetic_consumer(artifacts, scale):
+    """Consumer lookup + grid with ~`scale` x the cells (IR and LOI axes each grown by sqrt(scale))."""
+    if scale == 1:
+        return {}
+    grow = math.isqrt(scale - 1) + 1
+    buckets = artifacts["consumer_buckets"]
+    ir_buckets = _extend_buckets(buckets["ir_buckets"], len(buckets["ir_buckets"]) * grow)
+    loi_buckets = _extend_buckets(buckets["loi_buckets"], len(buckets["loi_buckets"]) * grow)
+    ir_arr = np.array(ir_buckets, dtype=np.int64)
+    loi_arr = np.array(loi_buckets, dtype=np.int64)
+
+    lookup, markets = {}, {}
+    for market in sorted({k[0] for k in artifacts["consumer_lookup"]}):
+        base = np.array([[artifacts["consumer_lookup"].get((market, min(ir, buckets["ir_buckets"][-1]),
+                                                                  min(loi, buckets["loi_buckets"][-1])), 0.0)
+                          for loi in loi_buckets] for ir in ir_buckets])
+        price = base + 0.01 * (ir_arr[:, None] - ir_arr[0]) + 0.05 * (loi_arr[None, :] - loi_arr[0])
+        for i, ir in enumerate(ir_buckets):
+            for j, loi in enumerate(loi_buckets):
+                lookup[(market, ir, loi)] = float(price[i, j])
+        markets[market] = {
+            "price": price,
+            "matched_ir": np.repeat(ir_arr[:, None], len(loi_buckets), axis=1),
+            "matched_loi": np.repeat(loi_arr[None, :], len(ir_buckets), axis=0),
+            "exact": np.ones(price.shape, dtype=bool),
+        }
+    return {
+        "consumer_lookup": lookup,
+        "consumer_buckets": {"ir_buckets": ir_buckets, "loi_buckets": loi_buckets},
+        "consumer_grid": {"ir_buckets": ir_buckets, "loi_buckets": loi_buckets, "markets": markets},
+    }
+
+
+def synthetic_artifacts(artifacts, scale, rng):
+    """The live artifacts grown `scale` x; band tables stay generators until the snapshot indexes them."""
+    grown = dict(artifacts)
+    for name in ("b2b_lookup", "acuity_b2b_lookup", "acuity_b2c_lookup"):
+        grown[name] = tiled_bands(artifacts[name], scale)
+    grown["b2b_client_lookup"] = synthetic_clients(artifacts["b2b_client_lookup"], scale, rng)
+    grown.update(synthetic_consumer(artifacts, scale))
+    return grown
+
+
+# ---------------- Queries ----------------
+def band_queries(rows, rng):
+    countries = sorted({r["country_name"] for r in rows})
+    return [(rng.choice(countries), f"{rng.randint(1, 100)}%", f"{rng.randint(1, 45)} min")
+            for _ in range(QUERIES)]
+
+
+def client_queries(names, rng, typos):
+    queries = []
+    for _ in range(QUERIES):
+        name = rng.choice(names)
+        if typos and len(name) >= 8:
+            k = rng.randrange(len(name))
+            name = name[:k] + rng.choice(string.ascii_lowercase) + name[k + 1:]
+        queries.append((name, rng.choice(["yes", "no"]), rng.choice(["yes", "no"])))
+    return queries
+
+
+def consumer_queries(snap, rng):
+    markets = ["USA", "United States", "India", "Germany", "Japan", "Brazil"]
+    max_ir, max_loi = snap.ir_buckets[-1], snap.loi_buckets[-1]
+    return [{"business_type": "b2c", "market": rng.choice(markets),
+             "ir": f"{rng.randint(1, max_ir + 10)}%", "loi": f"{rng.randint(1, max_loi + 15)} min"}
+            for _ in range(QUERIES)]
+
+
+# ---------------- Measurement ----------------
+def memory_mb():
+    fields = {}
+    with open("/proc/self/status") as fh:
+        for line in fh:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields["VmRSS"], fields["VmHWM"]
+
+
+def measure(fn, queries):
+    start = time.perf_counter()
+    for q in queries[:WARMUP]:
+        fn(q)
+        if time.perf_counter() - start > TIME_BUDGET / 4:
+            break
+    times = []
+    start = time.perf_counter()
+    for k in range(MAX_CALLS):
+        q = queries[k % len(queries)]
+        t = time.perf_counter_ns()
+        fn(q)
+        times.append(time.perf_counter_ns() - t)
+        if len(times) >= MIN_CALLS and time.perf_counter() - start > TIME_BUDGET:
+            break
+    times = np.array(times) / 1000
+    return {
+        "calls": len(times),
+        "p50_us": round(float(np.percentile(times, 50)), 2),
+        "p99_us": round(float(np.percentile(times, 99)), 2),
+        "mean_us": round(float(times.mean()), 2),
+        "ops_per_sec": round(len(times) / (times.sum() / 1e6), 1),
+    }
+
+
+def run_scale(artifacts, scale):
+    rng = random.Random(SEED)
+    gc.collect()
+    rss_before, _ = memory_mb()
+    start = time.perf_counter()
+    snap = PricingSnapshot(synthetic_artifacts(artifacts, scale, rng))
+    build_seconds = time.perf_counter() - start
+    gc.collect()
+    rss_after, peak = memory_mb()
+
+    # PredictCPI prices against the live snapshot; no cache, so every call does the work
+    snap.version = f"synthetic-{scale}x"
+    pricing_registry.current = snap
+    quote_cache.maxsize = 0
+    view = PredictCPI.as_view()
+    factory = APIRequestFactory()
+
+    def predict_cpi(quote):
+        response = view(factory.post("/predict-cpi/", quote, format="json"))
+        assert response.status_code == 200, response.data
+
+    client_names = list(snap.clients.by_client)
+    cases = {
+        "b2b_find_price": (lambda q: b2b_find_price(*q, snap=snap), band_queries(artifacts["b2b_lookup"], rng)),
+        "acuity_b2b_find_price": (lambda q: acuity_b2b_find_price(*q, snap=snap),
+                                  band_queries(artifacts["acuity_b2b_lookup"], rng)),
+        "b2b_with_client_find_price": (lambda q: b2b_with_client_find_price(*q, snap=snap),
+                                       client_queries(client_names, rng, typos=False)),
+        "b2b_with_client_find_price[typo]": (lambda q: b2b_with_client_find_price(*q, snap=snap),
+                                             client_queries(client_names, rng, typos=True)),
+        "PredictCPI[consumer]": (predict_cpi, consumer_queries(snap, rng)),
+    }
+    return {
+        "rows": {
+            "b2b_bands": sum(len(i) for i in snap.b2b_index.values()),
+            "acuity_b2b_bands": sum(len(i) for i in snap.acuity_b2b_index.values()),
+            "acuity_b2c_bands": sum(len(i) for i in snap.acuity_b2c_index.values()),
+            "clients": len(snap.clients.by_client),
+            "consumer_cells": len(snap.consumer_lookup),
+        },
+        "build_seconds": round(build_seconds, 3),
+        "memory_mb": {"snapshot_rss": round(rss_after - rss_before, 1), "peak_rss": round(peak, 1)},
+        "functions": {name: measure(fn, queries) for name, (fn, queries) in cases.items()},
+    }
+
+
+def run_forked(artifacts, scale):
+    """run_scale in a child process, so each scale starts from the same memory."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            result = run_scale(artifacts, scale)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        with os.fdopen(write_fd, "w") as fh:
+            json.dump(result, fh)
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fh:
+        data = fh.read()
+    os.waitpid(pid, 0)
+    return json.loads(data) if data else {"error": "child exited without a result"}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base, report):
+    print(f"\nvs {base.get('commit')} ({base.get('created_at')}):")
+    for scale, result in report["scales"].items():
+        old = base.get("scales", {}).get(scale, {}).get("functions", {})
+        for name, stats in result.get("functions", {}).items():
+            if name not in old:
+                continue
+            p50 = stats["p50_us"] / old[name]["p50_us"] - 1 if old[name]["p50_us"] else 0.0
+            p99 = stats["p99_us"] / old[name]["p99_us"] - 1 if old[name]["p99_us"] else 0.0
+            print(f"  {scale:>6}x {name:<34} p50 {p50:+7.1%}  p99 {p99:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scales", default=",".join(map(str, SCALES)))
+    parser.add_argument("--out", help="JSON report path (default benchmarks/results/pricing_scale-<commit>.json)")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    pricing_registry.wait()
+    _, artifacts = read_bundle(ARTIFACT_ROOT, ARTIFACT_FILES)
+    report = {
+        "benchmark": "pricing_scale",
+        "commit": git_commit(),
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scales": {},
+    }
+    for scale in map(int, args.scales.split(",")):
+        result = report["scales"][str(scale)] = run_forked(artifacts, scale)
+        if "error" in result:
+            print(f"{scale:>6}x  failed: {result['error']}")
+            continue
+        print(f"{scale:>6}x  build {result['build_seconds']:.2f}s  snapshot {result['memory_mb']['snapshot_rss']:.1f} MiB"
+              f"  peak {result['memory_mb']['peak_rss']:.1f} MiB")
+        for name, stats in result["functions"].items():
+            print(f"        {name:<34} p50 {stats['p50_us']:>10.1f}us  p99 {stats['p99_us']:>10.1f}us"
+                  f"  {stats['ops_per_sec']:>10.1f}/s")
+
+    out = args.out or os.path.join("benchmarks", "results", f"pricing_scale-{report['commit'] or 'unknown'}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"wrote {out}")
+    if args.compare:
+        with open(args.compare) as fh:
+            compare(json.load(fh), report)
+
+
+if __name__ == "__main__":
+    main()
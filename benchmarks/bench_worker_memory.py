@@ -0,0 +1,104 @@
+"""
+Per-worker memory of N forked workers (like `gunicorn --workers=N`), Linux only.
+
+  before: nothing preloaded; every worker imports the app and unpickles the
+          sklearn RandomForest (consumer_pricing_model.pkl), as the API used to.
+  after:  the master imports the app (`--preload`), which loads the flattened
+          forest with mmap_mode; workers fork from it and only price quotes.
+
+RSS counts shared pages in every worker; PSS splits them between the processes
+sharing them; private is what each extra worker really costs.
+
+    python benchmarks/bench_worker_memory.py [workers]
+"""
+import os
+import signal
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "predictcpi.settings")
+
+QUOTES = [
+    {"business_type": "b2c", "market": "USA", "ir": "37%", "loi": "13 min"},
+    {"business_type": "b2c", "market": "Japan", "ir": "55%", "loi": "150 min"},
+    {"business_type": "b2b", "market": "Germany", "ir": "10%", "loi": "15 min", "client_name": "acuity"},
+]
+
+
+def load_app():
+    import django
+
+    django.setup()
+    from predictcpi.views.training import pricing_registry
+
+    pricing_registry.wait()
+
+
+def work_before():
+    load_app()
+    import joblib
+    from predictcpi.views.training import pricing_registry
+
+    snap = pricing_registry.snapshot()
+    model = joblib.load("ml/consumer_pricing_model.pkl")
+    model.predict(snap.consumer_encoder.encode("USA", 55, 150))
+
+
+def work_after():
+    from predictcpi.views.training import consumer_model_predict, price_quote, pricing_registry
+
+    for quote in QUOTES:
+        price_quote(quote)
+    # LOI 150 is outside the baked model table, so this walks the forest arrays
+    consumer_model_predict("USA", 55, 150, pricing_registry.snapshot())
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Pss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def run(workers, work):
+    pids = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(ready_r)
+            work()
+            os.write(ready_w, b"1")
+            signal.pause()
+            os._exit(0)
+        os.close(ready_w)
+        os.read(ready_r, 1)
+        os.close(ready_r)
+        pids.append(pid)
+
+    stats = [memory_kb(pid) for pid in pids]
+    for pid in pids:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    return [sum(col) / len(stats) / 1024 for col in zip(*stats)]
+
+
+def main(workers=4):
+    before = run(workers, work_before)
+    load_app()  # --preload
+    master_rss = memory_kb(os.getpid())[0] / 1024
+    after = run(workers, work_after)
+
+    print(f"{workers} workers, per-worker MiB (master after preload: {master_rss:.1f} RSS)")
+    print(f"{'':<8} {'RSS':>8} {'PSS':>8} {'private':>8}")
+    for label, (rss, pss, private) in (("before", before), ("after", after)):
+        print(f"{label:<8} {rss:>8.1f} {pss:>8.1f} {private:>8.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
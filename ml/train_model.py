@@ -1,6 +1,12 @@
 import os
+import json
 import time
+import shutil
+import hashlib
+import importlib.util
+from datetime import datetime, timezone
 from math import ceil
+import numpy as np
 import pandas as pd
 import joblib
 import urllib.parse
@@ -8,6 +14,8 @@ from sqlalchemy import create_engine
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 from sklearn.ensemble import RandomForestRegressor
+from sklearn.linear_model import LogisticRegression
+from scipy.sparse import csr_matrix
 import math
 
 
@@ -22,10 +30,148 @@ engine = create_engine(db_url)
 
 os.makedirs("ml", exist_ok=True)
 
+# ---------------- Artifact bundle ----------------
+# Each run writes a complete bundle to ml/bundles/<version>/ with a manifest,
+# then swaps ml/CURRENT to it; the API loads whatever CURRENT points at.
+# Trainers take that bundle dir as `out_dir` and never write into ml/ itself: the flat
+# files there are checked against ml/manifest.json, so an edited one fails the boot.
+ARTIFACT_ROOT = "ml"
+BUNDLES_DIR = os.path.join(ARTIFACT_ROOT, "bundles")
+KEEP_BUNDLES = 3
+ARTIFACT_FILES = {
+    "consumer_model": "consumer_pricing_model.pkl",
+    "consumer_forest": "consumer_pricing_forest.pkl",
+    "consumer_features": "consumer_pricing_features.pkl",
+    "consumer_lookup": "consumer_pricing_lookup.pkl",
+    "consumer_buckets": "consumer_pricing_buckets.pkl",
+    "consumer_grid": "consumer_pricing_grid.pkl",
+    "consumer_model_table": "consumer_pricing_model_table.pkl",
+    "b2b_lookup": "qlab_b2b_pricing_lookup.pkl",
+    "acuity_b2b_lookup": "acuity_b2b_pricing_lookup.pkl",
+    "acuity_b2c_lookup": "acuity_b2c_pricing_lookup.pkl",
+    "b2b_client_lookup": "b2b_with_client_pricing_lookup.pkl",
+    "business_text_model": "business_text_model.pkl",
+}
+
+def dump_artifact(obj, name, out_dir):
+    if os.path.abspath(out_dir) == os.path.abspath(ARTIFACT_ROOT):
+        raise ValueError(f"write artifacts into a bundle under {BUNDLES_DIR}, not {ARTIFACT_ROOT}/ itself")
+    joblib.dump(obj, os.path.join(out_dir, ARTIFACT_FILES[name]))
+
+def write_manifest(bundle_dir, version):
+    """Record every artifact of the bundle with its sha256."""
+    artifacts = {}
+    for name, filename in ARTIFACT_FILES.items():
+        path = os.path.join(bundle_dir, filename)
+        if not os.path.exists(path):
+            continue
+        with open(path, "rb") as fh:
+            artifacts[name] = {"file": filename, "sha256": hashlib.sha256(fh.read()).hexdigest()}
+    with open(os.path.join(bundle_dir, "manifest.json"), "w") as fh:
+        json.dump({"version": version, "artifacts": artifacts}, fh, indent=2, sort_keys=True)
+
+def publish_bundle(bundle_dir, version):
+    """Write the manifest, atomically point ml/CURRENT at the bundle, prune old bundles."""
+    write_manifest(bundle_dir, version)
+    pointer = os.path.join(ARTIFACT_ROOT, "CURRENT")
+    tmp = pointer + ".tmp"
+    with open(tmp, "w") as fh:
+        fh.write(os.path.relpath(bundle_dir, ARTIFACT_ROOT) + "\n")
+    os.replace(tmp, pointer)
+
+    for old in sorted(os.listdir(BUNDLES_DIR))[:-KEEP_BUNDLES]:
+        path = os.path.join(BUNDLES_DIR, old)
+        if os.path.abspath(path) != os.path.abspath(bundle_dir):
+            shutil.rmtree(path, ignore_errors=True)
+    print(f"✅ Published artifact bundle {version}")
+
+# Integer input domain baked into the consumer model serving table
+CONSUMER_IR_DOMAIN = (1, 100)
+CONSUMER_LOI_DOMAIN = (1, 120)
+
+def build_consumer_grid(lookup, ir_buckets, loi_buckets):
+    """
+    Dense per-market price grid over (ir_bucket, loi_bucket).
+    Each cell holds the exact lookup price, or else the lookup entry of that market
+    nearest by L1 distance on (ir, loi) (first in lookup order on ties).
+    """
+    ir_arr = np.asarray(ir_buckets, dtype=np.int64)
+    loi_arr = np.asarray(loi_buckets, dtype=np.int64)
+
+    entries = {}
+    for (mkt, ir_k, loi_k), price in lookup.items():
+        entries.setdefault(mkt, []).append((ir_k, loi_k, price))
+
+    markets = {}
+    for mkt, rows in entries.items():
+        e_ir = np.array([r[0] for r in rows], dtype=np.int64)
+        e_loi = np.array([r[1] for r in rows], dtype=np.int64)
+        e_price = np.array([r[2] for r in rows], dtype=np.float64)
+
+        # (n_ir, n_loi, n_entries) distance cube; argmin keeps the first minimum
+        dist = np.abs(ir_arr[:, None, None] - e_ir) + np.abs(loi_arr[None, :, None] - e_loi)
+        best = dist.argmin(axis=2)
+        markets[mkt] = {
+            "price": e_price[best],
+            "matched_ir": e_ir[best],
+            "matched_loi": e_loi[best],
+            "exact": dist.min(axis=2) == 0,
+        }
+
+    return {"ir_buckets": list(ir_buckets), "loi_buckets": list(loi_buckets), "markets": markets}
+
+def build_consumer_model_table(model, model_features):
+    """
+    Model predictions for every market x integer IR x integer LOI in the serving
+    domain, computed in one batch. prices[m, ir - ir_min, loi - loi_min].
+    """
+    markets = [f[len('market_'):] for f in model_features if f.startswith('market_')]
+    ir_values = np.arange(CONSUMER_IR_DOMAIN[0], CONSUMER_IR_DOMAIN[1] + 1)
+    loi_values = np.arange(CONSUMER_LOI_DOMAIN[0], CONSUMER_LOI_DOMAIN[1] + 1)
+
+    m_idx, ir_grid, loi_grid = np.meshgrid(np.arange(len(markets)), ir_values, loi_values, indexing='ij')
+    X = pd.DataFrame(0, index=range(m_idx.size), columns=model_features)
+    for k, mkt in enumerate(markets):
+        X[f'market_{mkt}'] = (m_idx.ravel() == k).astype(int)
+    X['incidence_rate'] = ir_grid.ravel()
+    X['loi_minutes'] = loi_grid.ravel()
+
+    prices = model.predict(X).reshape(len(markets), len(ir_values), len(loi_values))
+    return {
+        "markets": markets,
+        "ir_min": int(ir_values[0]),
+        "loi_min": int(loi_values[0]),
+        "prices": prices.astype(np.float64),
+    }
+
+def build_forest_arrays(model):
+    """
+    Flatten a fitted RandomForestRegressor into plain arrays (all trees concatenated,
+    child indices global, leaves with left == -1) for predictcpi/views/forest.py.
+    Dumped uncompressed so the API can load it with mmap_mode and never import sklearn.
+    """
+    trees = [est.tree_ for est in model.estimators_]
+    offsets = np.cumsum([0] + [t.node_count for t in trees[:-1]]).astype(np.int64)
+
+    def children(attr):
+        return np.concatenate([
+            np.where(getattr(t, attr) >= 0, getattr(t, attr) + off, -1) for t, off in zip(trees, offsets)
+        ]).astype(np.int64)
+
+    return {
+        "roots": offsets,
+        "feature": np.concatenate([t.feature for t in trees]).astype(np.int64),
+        "threshold": np.concatenate([t.threshold for t in trees]).astype(np.float64),
+        "left": children("children_left"),
+        "right": children("children_right"),
+        "value": np.concatenate([t.value[:, 0, 0] for t in trees]).astype(np.float64),
+        "n_features": int(model.n_features_in_),
+    }
+
 # =========================
 # CONSUMER TRAINING (unchanged)
 # =========================
-def train_consumer():
+def train_consumer(out_dir):
     print("📥 Loading data from consumer_pricing...")
     df = pd.read_sql("SELECT * FROM consumer_pricing", engine)
 
@@ -75,17 +221,20 @@ def train_consumer():
     r2 = r2_score(y_test, y_pred)
 
     # Save artifacts
-    joblib.dump(model, "ml/consumer_pricing_model.pkl")
-    joblib.dump(model_features, "ml/consumer_pricing_features.pkl")
-    joblib.dump(lookup, "ml/consumer_pricing_lookup.pkl")
-    joblib.dump({'ir_buckets': ir_buckets, 'loi_buckets': loi_buckets}, "ml/consumer_pricing_buckets.pkl")
+    dump_artifact(model, "consumer_model", out_dir)
+    dump_artifact(build_forest_arrays(model), "consumer_forest", out_dir)
+    dump_artifact(model_features, "consumer_features", out_dir)
+    dump_artifact(lookup, "consumer_lookup", out_dir)
+    dump_artifact({'ir_buckets': ir_buckets, 'loi_buckets': loi_buckets}, "consumer_buckets", out_dir)
+    dump_artifact(build_consumer_grid(lookup, ir_buckets, loi_buckets), "consumer_grid", out_dir)
+    dump_artifact(build_consumer_model_table(model, model_features), "consumer_model_table", out_dir)
 
     print(f"✅ Consumer Model trained (rows={len(df)}, mse={mse:.4f}, r2={r2:.4f})")
 
 # =========================
 # B2B TRAINING (NEW STRUCTURE)
 # =========================
-def train_b2b():
+def train_b2b(out_dir):
     print("📥 Loading data from qlab_b2b_pricing...")
     df = pd.read_sql("SELECT * FROM qlab_b2b_pricing", engine)
 
@@ -102,7 +251,7 @@ def train_b2b():
             "price": float(row['price'])
         })
 
-    joblib.dump(records, "ml/qlab_b2b_pricing_lookup.pkl")
+    dump_artifact(records, "b2b_lookup", out_dir)
     print(f"✅ B2B lookup saved (rows={len(records)})")
 
 
@@ -116,7 +265,7 @@ def _ensure_range(val):
     return (val, val)  # wrap int into a tuple
 
 
-def train_acuity_b2b():
+def train_acuity_b2b(out_dir):
     print("📥 Loading data from b2b_cpi_pricing_acquity...")
     df = pd.read_sql("SELECT * FROM b2b_cpi_pricing_acquity", engine)
 
@@ -142,11 +291,11 @@ def train_acuity_b2b():
         })
 
     # save lookup
-    joblib.dump(records, "ml/acuity_b2b_pricing_lookup.pkl")
+    dump_artifact(records, "acuity_b2b_lookup", out_dir)
     print(f"✅ Acuity B2B lookup saved (rows={len(records)})")
 
 
-def train_acuity_b2c():
+def train_acuity_b2c(out_dir):
     print("📥 Loading data from b2c_cpi_pricing_acquity...")
     df = pd.read_sql("SELECT * FROM b2c_cpi_pricing_acquity", engine)
 
@@ -172,11 +321,11 @@ def train_acuity_b2c():
         })
 
     # save lookup
-    joblib.dump(records, "ml/acuity_b2c_pricing_lookup.pkl")
+    dump_artifact(records, "acuity_b2c_lookup", out_dir)
     print(f"✅ Acuity B2C lookup saved (rows={len(records)})")
 
 
-def train_b2b_with_client():
+def train_b2b_with_client(out_dir):
     print("📥 Loading data from survey_pricing...")
     df = pd.read_sql("SELECT * FROM survey_pricing", engine)
 
@@ -194,16 +343,103 @@ def train_b2b_with_client():
         })
 
     # save lookup
-    joblib.dump(records, "ml/b2b_with_client_pricing_lookup.pkl")
+    dump_artifact(records, "b2b_client_lookup", out_dir)
     print(f"✅ B2B with client lookup saved (rows={len(records)})")
 
 
 
+# =========================
+# B2B / B2C TEXT MODEL
+# =========================
+# The featurizer is the API's own, loaded from predictcpi/views/textmodel.py by file path
+# (that module is Django-free; importing it as a package would set up every view)
+def _load_module(name, path):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+textmodel = _load_module("textmodel", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "predictcpi", "views", "textmodel.py"))
+TEXT_N_FEATURES = 2 ** 18
+# Answers must be at least this accurate on held-out RFQs to skip the LLM
+TEXT_TARGET_PRECISION = 0.97
+TEXT_MIN_ROWS = 200
+
+def business_text_matrix(texts):
+    rows, cols, vals = [], [], []
+    for i, text in enumerate(texts):
+        for bucket, weight in textmodel.business_text_features(text, TEXT_N_FEATURES).items():
+            rows.append(i)
+            cols.append(bucket)
+            vals.append(weight)
+    return csr_matrix((vals, (rows, cols)), shape=(len(texts), TEXT_N_FEATURES))
+
+def confidence_threshold(proba, correct, target=TEXT_TARGET_PRECISION):
+    """
+    Lowest confidence whose answers (all predictions at least that confident)
+    are `target` accurate; None if none is (the API then never uses the model).
+    """
+    order = np.argsort(-proba, kind="stable")
+    accuracy = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+    ok = np.nonzero(accuracy >= target)[0]
+    return float(proba[order][ok[-1]]) if len(ok) else None
+
+def train_business_text(out_dir):
+    print("📥 Loading RFQ audiences from email_data...")
+    df = pd.read_sql("SELECT target_audience, dm_type FROM email_data", engine)
+    df = df.dropna(subset=['target_audience', 'dm_type'])
+
+    df['target_audience'] = df['target_audience'].astype(str).str.strip()
+    df['dm_type'] = df['dm_type'].astype(str).str.upper().str.strip()
+    df = df[(df['target_audience'] != '') & df['dm_type'].isin(['B2B', 'B2C'])]
+    if len(df) < TEXT_MIN_ROWS or df['dm_type'].nunique() < 2:
+        print(f"⚠️ Text model skipped: {len(df)} labeled rows, labels {sorted(df['dm_type'].unique())}")
+        return
+
+    classes = sorted(df['dm_type'].unique())   # ['B2B', 'B2C']; coef points towards B2C
+    X = business_text_matrix(df['target_audience'].tolist())
+    y = (df['dm_type'] == classes[1]).astype(int).to_numpy()
+
+    # Threshold from held-out predictions, then the served model is refit on every row
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    model = LogisticRegression(C=4.0, max_iter=2000, class_weight="balanced")
+    model.fit(X_train, y_train)
+    p = model.predict_proba(X_test)[:, 1]
+    confidence = np.maximum(p, 1 - p)
+    correct = (p >= 0.5).astype(int) == y_test
+    threshold = confidence_threshold(confidence, correct)
+    coverage = float((confidence >= threshold).mean()) if threshold is not None else 0.0
+
+    model = LogisticRegression(C=4.0, max_iter=2000, class_weight="balanced")
+    model.fit(X, y)
+
+    dump_artifact({
+        "featurizer": textmodel.FEATURIZER,
+        "n_features": TEXT_N_FEATURES,
+        "coef": model.coef_[0].astype(np.float32),
+        "intercept": float(model.intercept_[0]),
+        "classes": classes,
+        "threshold": threshold,
+        "trained_on": int(len(df)),
+    }, "business_text_model", out_dir)
+    print(f"✅ Text model trained (rows={len(df)}, holdout acc={correct.mean():.4f}, "
+          f"threshold={threshold if threshold is None else round(threshold, 3)}, coverage={coverage:.2%})")
+
+
+
 if __name__ == "__main__":
-    train_consumer()
-    train_b2b()
-    train_acuity_b2b()
-    train_acuity_b2c()
-    train_b2b_with_client()
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    bundle_dir = os.path.join(BUNDLES_DIR, version)
+    os.makedirs(bundle_dir, exist_ok=True)
+
+    train_consumer(bundle_dir)
+    train_b2b(bundle_dir)
+    train_acuity_b2b(bundle_dir)
+    train_acuity_b2c(bundle_dir)
+    train_b2b_with_client(bundle_dir)
+    train_business_text(bundle_dir)
+
+    publish_bundle(bundle_dir, version)
 
 
@@ -16,13 +16,20 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path,include
-from .views import PredictCPI
-from .views import input_form_view,SubmitTextAPI
+from .views import PredictCPI, PredictCPIBatch, PredictCPISweep, PriceCacheStats, PriceTimingStats, ReadyZ, Metrics
+from .views import input_form_view,SubmitTextAPI,ClassificationCacheAPI
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('predict-cpi/', PredictCPI.as_view(), name='predict-cpi'),
+    path('predict-cpi/batch/', PredictCPIBatch.as_view(), name='predict-cpi-batch'),
+    path('predict-cpi/sweep/', PredictCPISweep.as_view(), name='predict-cpi-sweep'),
+    path('predict-cpi/cache-stats/', PriceCacheStats.as_view(), name='predict-cpi-cache-stats'),
+    path('predict-cpi/timing-stats/', PriceTimingStats.as_view(), name='predict-cpi-timing-stats'),
+    path('readyz', ReadyZ.as_view(), name='readyz'),
+    path('metrics', Metrics.as_view(), name='metrics'),
     path('form/', input_form_view, name='input_form'),
     path('api/submit-text/', SubmitTextAPI.as_view(), name='submit_text_api'),
+    path('api/classification-cache/', ClassificationCacheAPI.as_view(), name='classification_cache_api'),
 
 ]
@@ -1,3 +1,3 @@
-from .training import PredictCPI
-from .inputformhandler import input_form_view,SubmitTextAPI
+from .training import PredictCPI, PredictCPIBatch, PredictCPISweep, PriceCacheStats, PriceTimingStats, ReadyZ, Metrics
+from .inputformhandler import input_form_view,SubmitTextAPI,ClassificationCacheAPI
 from .countries import countries
@@ -0,0 +1,307 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import joblib
+
+
+# ---------------- Bundle layout ----------------
+# <root>/CURRENT            -> relative path of the live bundle (e.g. 'bundles/20261018T101500Z')
+# <bundle>/manifest.json    -> {"version": ..., "artifacts": {name: {"file": ..., "sha256": ...}}}
+# Without CURRENT the root itself is the bundle.
+POINTER = "CURRENT"
+MANIFEST = "manifest.json"
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_pointer(root):
+    """Contents of <root>/CURRENT, or None when the root has no pointer (flat layout)."""
+    try:
+        with open(os.path.join(root, POINTER)) as fh:
+            return fh.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def resolve_bundle_dir(root, rel=None):
+    rel = read_pointer(root) if rel is None else rel
+    return os.path.join(root, rel) if rel else root
+
+
+def open_bundle(root, default_files=None):
+    """
+    Resolve the live bundle and read its manifest: (bundle_dir, manifest).
+    When CURRENT exists, the bundle it names must exist and have a manifest,
+    or FileNotFoundError is raised (a pruned, mistyped or half-synced bundle
+    is never served). Only a flat root without CURRENT may lack a manifest;
+    it then falls back to `default_files` ({name: file}), loaded unverified.
+    When `default_files` is given, manifest entries not named there are dropped.
+    """
+    rel = read_pointer(root)
+    if rel == "":
+        raise FileNotFoundError(f"{os.path.join(root, POINTER)} is empty")
+    bundle_dir = resolve_bundle_dir(root, rel)
+    try:
+        with open(os.path.join(bundle_dir, MANIFEST)) as fh:
+            manifest = json.load(fh)
+    except FileNotFoundError:
+        if rel is not None:
+            raise FileNotFoundError(f"{POINTER} points at {bundle_dir!r}, which has no {MANIFEST}") from None
+        manifest = {
+            "version": "unversioned",
+            "artifacts": {name: {"file": f} for name, f in (default_files or {}).items()},
+        }
+    if default_files is not None:
+        manifest["artifacts"] = {n: e for n, e in manifest["artifacts"].items() if n in default_files}
+    return bundle_dir, manifest
+
+
+def load_artifacts(bundle_dir, manifest, names=None, mmap_names=()):
+    """
+    Load the manifest's artifacts (only `names`, if given), verifying checksums.
+    Artifacts in `mmap_names` are loaded with mmap_mode='r' (their arrays stay
+    file-backed). Unverified files that don't exist are skipped.
+    """
+    objects = {}
+    for name, entry in manifest["artifacts"].items():
+        if names is not None and name not in names:
+            continue
+        path = os.path.join(bundle_dir, entry["file"])
+        if name in mmap_names:
+            if not os.path.exists(path) and "sha256" not in entry:
+                continue
+            if "sha256" in entry and sha256_file(path) != entry["sha256"]:
+                raise ValueError(f"checksum mismatch for {name} ({path})")
+            objects[name] = joblib.load(path, mmap_mode="r")
+            continue
+        try:
+            with open(path, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            if "sha256" in entry:
+                raise
+            continue
+        if "sha256" in entry and sha256_bytes(data) != entry["sha256"]:
+            raise ValueError(f"checksum mismatch for {name} ({path})")
+        objects[name] = joblib.load(io.BytesIO(data))
+    return objects
+
+
+def read_bundle(root, default_files=None, mmap_names=()):
+    """Load every artifact of the live bundle: (version, {name: object})."""
+    bundle_dir, manifest = open_bundle(root, default_files)
+    return manifest["version"], load_artifacts(bundle_dir, manifest, mmap_names=mmap_names)
+
+
+# ---------------- Registry ----------------
+class ArtifactRegistry:
+    """
+    Holds the live pricing snapshot for this process.
+
+    `start()` loads the bundle on a background thread. With `stages` (tuples
+    of artifact names, anything unlisted goes last) the first load publishes
+    a partial snapshot after each stage, `complete` False until the last one,
+    so requests can use the cheap tables before the heavy ones are in. Reloads
+    only ever publish complete snapshots.
+
+    `snapshot()` returns the current snapshot without blocking (or waits up to
+    `wait` seconds for the first one); at most once per `check_interval` it
+    stats the bundle pointer, manifest and artifact files, and on change a
+    background thread loads and builds the new bundle, then publishes it with
+    a single reference assignment. Callers keep whichever snapshot they got for the whole
+    request. `listeners` are called with each published snapshot.
+
+    A fork waits for an in-flight load first, so children (gunicorn --preload
+    workers) start from the parent's snapshot rather than a half-done load.
+    """
+
+    def __init__(self, root, build, default_files=None, mmap_names=(), stages=(), check_interval=1.0):
+        self.root = root
+        self.build = build
+        self.default_files = default_files
+        self.mmap_names = frozenset(mmap_names)
+        self.stages = [tuple(stage) for stage in stages]
+        self.check_interval = check_interval
+        self.current = None
+        self.signature = None
+        self.files = ()
+        self.checked_at = 0.0
+        self.loaded_at = None
+        self.load_seconds = None
+        self.artifact_seconds = {}
+        self.error = None
+        self.listeners = []
+        self.published = threading.Event()
+        self._loading = False
+        self._thread = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(before=self._before_fork, after_in_child=self._after_fork_in_child)
+
+    def _stat(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _signature(self):
+        # the artifact files too: in the flat layout a pickle can be replaced in place, and
+        # the reload that notices it fails loudly on the checksum instead of at the next boot
+        bundle_dir = resolve_bundle_dir(self.root)
+        return (
+            self._stat(os.path.join(self.root, POINTER)),
+            bundle_dir,
+            self._stat(os.path.join(bundle_dir, MANIFEST)),
+            tuple(self._stat(path) for path in self.files),
+        )
+
+    def _stage_names(self, manifest):
+        names = list(manifest["artifacts"])
+        listed = {n for stage in self.stages for n in stage}
+        stages = [[n for n in stage if n in names] for stage in self.stages]
+        stages.append([n for n in names if n not in listed])
+        return [stage for stage in stages if stage] or [[]]
+
+    def _publish(self, snapshot, artifact_seconds):
+        self.current = snapshot
+        self.artifact_seconds = artifact_seconds
+        self.loaded_at = time.time()
+        self.error = None
+        self.published.set()
+        for listener in self.listeners:
+            listener(snapshot)
+
+    def load(self):
+        """Load and publish the live bundle synchronously."""
+        start = time.perf_counter()
+        bundle_dir, manifest = open_bundle(self.root, self.default_files)
+        self.files = tuple(os.path.join(bundle_dir, e["file"]) for e in manifest["artifacts"].values())
+        signature = self._signature()
+        staged = self.current is None or not self.current.complete
+        stages = self._stage_names(manifest)
+
+        objects, seconds = {}, {}
+        for k, names in enumerate(stages):
+            for name in names:
+                t = time.perf_counter()
+                objects.update(load_artifacts(bundle_dir, manifest, (name,), self.mmap_names))
+                if name in objects:
+                    seconds[name] = time.perf_counter() - t
+            complete = k == len(stages) - 1
+            if complete or staged:
+                snapshot = self.build(objects)
+                snapshot.version = manifest["version"]
+                snapshot.complete = complete
+                self._publish(snapshot, dict(seconds))
+
+        self.signature = signature
+        self.load_seconds = time.perf_counter() - start
+        return snapshot
+
+    def _reload(self, signature):
+        try:
+            self.load()
+        except Exception as e:
+            # keep serving the previous snapshot; retry when the bundle changes again
+            self.error = str(e)
+            self.signature = signature
+            serving = self.current.version if self.current is not None else "nothing"
+            print(f"artifact load failed, still serving {serving}: {e}")
+        finally:
+            self._loading = False
+
+    def _spawn(self, signature):
+        with self._lock:
+            if self._loading:
+                return False
+            self._loading = True
+        self._thread = threading.Thread(target=self._reload, args=(signature,), daemon=True)
+        self._thread.start()
+        return True
+
+    def start(self):
+        """Load the live bundle on a background thread (no-op while a load is running)."""
+        return self._spawn(self._signature())
+
+    def check(self):
+        """Start a background reload if the live bundle changed on disk."""
+        signature = self._signature()
+        if signature == self.signature:
+            return False
+        return self._spawn(signature)
+
+    def wait(self, timeout=None):
+        """Block until the running load (if any) finishes; returns the current snapshot."""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        return self.current
+
+    def failed(self):
+        """The error of the last load if it failed and none is running now, else None."""
+        return None if self._loading else self.error
+
+    def snapshot(self, wait=None):
+        # only worth waiting for a load that is running; a failed one leaves nothing to wait for
+        if self.current is None and wait and self._loading:
+            self.published.wait(wait)
+        snapshot = self.current
+        now = time.monotonic()
+        if now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            self.check()
+        return snapshot
+
+    def status(self):
+        """Readiness report: which artifacts the current snapshot has loaded."""
+        snapshot = self.current
+        complete = bool(snapshot is not None and snapshot.complete)
+        failed = not complete and self.failed() is not None
+        names = dict.fromkeys(list(self.default_files or ()) + list(self.artifact_seconds))
+        artifacts = {}
+        for name in names:
+            if name in self.artifact_seconds:
+                artifacts[name] = {"state": "warm", "load_ms": round(self.artifact_seconds[name] * 1000, 2)}
+            else:
+                artifacts[name] = {"state": "missing" if complete else "failed" if failed else "cold"}
+        return {
+            "ready": complete,
+            "failed": failed,
+            "version": snapshot.version if snapshot is not None else None,
+            "loading": self._loading,
+            "loaded_at": self.loaded_at,
+            "load_seconds": self.load_seconds,
+            "error": self.error,
+            "artifacts": artifacts,
+        }
+
+    def _before_fork(self):
+        # a child would have no loader thread, and could inherit locks it held
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(60)
+
+    def _after_fork_in_child(self):
+        self._lock = threading.Lock()
+        self._loading = False
+        self._thread = None
+        self.published = threading.Event()
+        if self.current is not None:
+            self.published.set()
+        if self.current is None or not self.current.complete:
+            self.start()
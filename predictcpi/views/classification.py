@@ -0,0 +1,282 @@
+import hashlib
+import os
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+from .cache import TTLCache
+
+
+# ---------------- Audience text keys ----------------
+def normalize_audience_text(text):
+    """Lowercase, whitespace collapsed: RFQs that differ only in layout share a key."""
+    return " ".join(str(text or "").lower().split())
+
+
+def audience_key(text):
+    return hashlib.sha256(normalize_audience_text(text).encode("utf-8")).hexdigest()
+
+
+# ---------------- Two-tier label cache ----------------
+class ClassificationCache:
+    """
+    Business-type labels by audience_key, in two tiers:
+
+    - local: TTLCache in this process (first stop, no I/O)
+    - db:    `table` in the `using` database, shared by every worker and
+             kept across restarts; a db hit is copied into the local tier
+             for the rest of its lifetime. The tier is turned off when that
+             database is in-memory sqlite (private to one connection, so
+             neither shared nor persistent) or not configured.
+
+    Entries expire `ttl` seconds after they were stored; with the db tier on,
+    local copies live only `local_ttl` seconds and then revalidate against
+    the table. `bust(key)` drops one entry, `bust()` all of them: from the
+    table, this worker's local tier, and, via the append-only `bust_log`
+    file every worker on the host polls (each `bust_check_interval`
+    seconds), the other workers' local tiers. A bust therefore reaches every
+    worker on the host within bust_check_interval, and workers on other
+    hosts (db tier only) within local_ttl. Database errors are logged and
+    treated as misses, so classification never fails because of the cache.
+
+    `acquire` / `release` / `wait` are a lease lock per key in `<table>_lock`,
+    so workers can agree that only one of them asks upstream for a key while
+    the others wait for its label to land in the table.
+    """
+
+    TABLE = "business_classification_cache"
+
+    def __init__(self, maxsize=1024, ttl=30 * 86400, use_db=True, table=TABLE, using=DEFAULT_DB_ALIAS,
+                 local_ttl=300, bust_log=None, bust_check_interval=1.0):
+        self.ttl = ttl
+        self.table = table
+        self.using = using
+        self.use_db = use_db and self._shared_db(using)
+        # without the table the local tier is the only copy: keep it for the full ttl
+        self.local_ttl = min(local_ttl, ttl) if self.use_db else ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=self.local_ttl)
+        self.bust_log = bust_log
+        self.bust_check_interval = bust_check_interval
+        self._bust_checked = 0.0
+        # busts logged before this process started concern entries it never had
+        self._bust_offset = self._log_size()
+        self.db_hits = 0
+        self.db_misses = 0
+        # connections are per thread (and can be re-opened): remember which one has the tables
+        self._ready = threading.local()
+
+    @staticmethod
+    def _shared_db(using):
+        db = connections.settings.get(using)
+        if db is None:
+            print(f"classification cache: no database {using!r}, db tier off")
+            return False
+        name = str(db.get("NAME") or "")
+        if "sqlite" in db.get("ENGINE", "") and (name in ("", ":memory:") or "mode=memory" in name):
+            print(f"classification cache: database {using!r} is in-memory sqlite, db tier off")
+            return False
+        return True
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def _ensure_table(self, cursor):
+        raw = self.connection.connection
+        if getattr(self._ready, "connection", None) is raw:
+            return
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " text_hash CHAR(64) NOT NULL PRIMARY KEY,"
+            " label VARCHAR(16) NOT NULL,"
+            " created_at BIGINT NOT NULL,"
+            " expires_at BIGINT NOT NULL)"
+        )
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table}_lock ("
+            " text_hash CHAR(64) NOT NULL PRIMARY KEY,"
+            " expires_at DOUBLE PRECISION NOT NULL)"
+        )
+        self._ready.connection = raw
+
+    def _read_db(self, key):
+        """(label, seconds left) from the table, or (None, 0) if absent, expired or unreadable."""
+        try:
+            with self.connection.cursor() as cursor:
+                self._ensure_table(cursor)
+                cursor.execute(f"SELECT label, expires_at FROM {self.table} WHERE text_hash = %s", [key])
+                row = cursor.fetchone()
+        except Exception as e:
+            print(f"classification cache read failed: {e}")
+            return None, 0
+        remaining = row[1] - time.time() if row else 0
+        return (row[0], remaining) if remaining > 0 else (None, 0)
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.bust_log) if self.bust_log else 0
+        except OSError:
+            return 0
+
+    def _apply_busts(self):
+        """Drop local entries busted by any worker since the last check (one stat per interval)."""
+        if not self.bust_log:
+            return
+        now = time.monotonic()
+        if now - self._bust_checked < self.bust_check_interval:
+            return
+        self._bust_checked = now
+        offset, size = self._bust_offset, self._log_size()
+        if size == offset:
+            return
+        if size < offset:
+            # log truncated or replaced: can't tell what was busted
+            self.local.clear()
+            self._bust_offset = size
+            return
+        try:
+            with open(self.bust_log, "rb") as fh:
+                fh.seek(offset)
+                data = fh.read(size - offset)
+        except OSError as e:
+            print(f"classification bust log unreadable: {e}")
+            return
+        complete = data.rfind(b"\n") + 1   # a line still being appended waits for the next check
+        for line in data[:complete].decode("ascii", "replace").splitlines():
+            key = line.rsplit(" ", 1)[-1]
+            if key == "*":
+                self.local.clear()
+            else:
+                self.local.delete(key)
+        self._bust_offset = offset + complete
+
+    def _log_bust(self, key):
+        if not self.bust_log:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.bust_log) or ".", exist_ok=True)
+            with open(self.bust_log, "a", encoding="ascii") as fh:
+                fh.write(f"{time.time():.3f} {key or '*'}\n")
+        except OSError as e:
+            print(f"classification bust not logged for other workers: {e}")
+
+    def get(self, key):
+        """(label, tier) with tier 'local' or 'db', or (None, None)."""
+        self._apply_busts()
+        label = self.local.get(key)
+        if label is not None:
+            return label, "local"
+        if not self.use_db:
+            return None, None
+        label, remaining = self._read_db(key)
+        if label is None:
+            self.db_misses += 1
+            return None, None
+        self.db_hits += 1
+        self.local.set(key, label, ttl=min(self.local_ttl, remaining))
+        return label, "db"
+
+    def set(self, key, label):
+        self.local.set(key, label)
+        if not self.use_db:
+            return
+        now = int(time.time())
+        try:
+            with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+                self._ensure_table(cursor)
+                cursor.execute(f"DELETE FROM {self.table} WHERE text_hash = %s", [key])
+                cursor.execute(
+                    f"INSERT INTO {self.table} (text_hash, label, created_at, expires_at) VALUES (%s, %s, %s, %s)",
+                    [key, label, now, now + int(self.ttl)],
+                )
+        except Exception as e:
+            print(f"classification cache write failed: {e}")
+
+    def bust(self, key=None):
+        """Drop one entry (or every entry) from both tiers; returns the db rows removed."""
+        if key is None:
+            self.local.clear()
+        else:
+            self.local.delete(key)
+        self._log_bust(key)
+        if not self.use_db:
+            return 0
+        try:
+            with self.connection.cursor() as cursor:
+                self._ensure_table(cursor)
+                if key is None:
+                    cursor.execute(f"DELETE FROM {self.table}")
+                    removed = cursor.rowcount
+                    cursor.execute(f"DELETE FROM {self.table}_lock")
+                else:
+                    cursor.execute(f"DELETE FROM {self.table} WHERE text_hash = %s", [key])
+                    removed = cursor.rowcount
+                return removed
+        except Exception as e:
+            print(f"classification cache bust failed: {e}")
+            return 0
+
+    def acquire(self, key, lease):
+        """
+        Take the cross-worker lock for `key` for `lease` seconds (an expired lease is taken over).
+        False if another worker holds it; True also when the database can't be reached.
+        """
+        if not self.use_db:
+            return True
+        now = time.time()
+        try:
+            with self.connection.cursor() as cursor:
+                self._ensure_table(cursor)
+                cursor.execute(f"DELETE FROM {self.table}_lock WHERE text_hash = %s AND expires_at < %s", [key, now])
+            with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {self.table}_lock (text_hash, expires_at) VALUES (%s, %s)",
+                               [key, now + lease])
+            return True
+        except IntegrityError:
+            return False
+        except Exception as e:
+            print(f"classification lock failed: {e}")
+            return True
+
+    def release(self, key):
+        if not self.use_db:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {self.table}_lock WHERE text_hash = %s", [key])
+        except Exception as e:
+            print(f"classification unlock failed: {e}")
+
+    def wait(self, key, timeout, poll=0.1):
+        """Poll for the label another worker is fetching; None once `timeout` passes or its lock is gone."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            time.sleep(poll)
+            label, _ = self._read_db(key)
+            if label is not None:
+                self.local.set(key, label)
+                return label
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(f"SELECT 1 FROM {self.table}_lock WHERE text_hash = %s AND expires_at >= %s",
+                                   [key, time.time()])
+                    held = cursor.fetchone() is not None
+            except Exception as e:
+                print(f"classification lock poll failed: {e}")
+                return None
+            if not held:
+                return self._read_db(key)[0]
+        return None
+
+    def stats(self):
+        total = self.db_hits + self.db_misses
+        return {
+            "local": self.local.stats(),
+            "db": {
+                "enabled": self.use_db,
+                "hits": self.db_hits,
+                "misses": self.db_misses,
+                "hit_ratio": round(self.db_hits / total, 4) if total else 0.0,
+            },
+        }
@@ -26,6 +26,9 @@ import pickle
 import pandas as pd
 import unicodedata
 
+from .metrics import metrics
+from .heuristics import classify_household, find_decision_maker
+
 
 
 load_dotenv()
@@ -224,147 +227,6 @@ def extract_industries(full_text):
 
 
 
-def classify_household(full_text: str) -> str | None:
-    """
-    Classify text as 'b2c' if it contains household + decision maker keywords,
-    'b2b' if it only contains decision maker keywords,
-    or None if neither is found.
-    """
-
-    dm_keywords = [
-        r"decision\s*maker[s]?",
-        r"decision-?maker[s]?",
-        r"dm[s]?",
-        r"decisionmaker[s]?"
-    ]
-
-    # household exception → B2C
-    b2c_pattern = re.compile(
-        r"(house\s*hold|household)\s*(" + "|".join(dm_keywords) + r")",
-        re.IGNORECASE
-    )
-
-    # General DM keywords → B2B
-    b2b_pattern = re.compile(
-        r"(" + "|".join(dm_keywords) + r")",
-        re.IGNORECASE
-    )
-
-    if b2c_pattern.search(full_text):
-        return "b2c"
-    elif b2b_pattern.search(full_text):
-        return "b2b"
-    else:
-        return None
-
-
-def find_decision_maker(full_text):
-   
-    matches = set()
-    pet_keywords = [ "pet store", "pet shop", "pet" ]
-    pet_matches = [kw for kw in pet_keywords if kw.lower() in full_text.lower()]
-
-    if pet_matches:
-        return "b2b"
-    
-    
-    liquor_keywords = [ "liquor store", "liquor shop", "liquor" ]
-    liquor_matches = [kw for kw in liquor_keywords if kw.lower() in full_text.lower()]
-
-    if liquor_matches:
-        return "b2b"
-
-    b2b_keywords = [ "b2b", "b-2-b", "Business-to-Business", "Business-2-Business", "Business 2 Business", "Manager+ & Sr. Manager", "Director+ & VP+ Titles", "C-level"]
-    b2b_matches = [kw for kw in b2b_keywords if kw.lower() in full_text.lower()]
-
-    if b2b_matches:
-        return "b2b"
-    
-    automotive_keywords = [ "automative dealership", "automotive dealership", "automotive" ]
-    automotive_matches = [kw for kw in automotive_keywords if kw.lower() in full_text.lower()]
-
-    if automotive_matches:
-        return "b2b"
-    
-    result = classify_household(full_text)
-
-    if result == "b2c":
-        return result
-    
-    elif result == "b2b":
-        return result
-
-    b2c_keywords = [  
-        "General Population", "gen. pop", "gen pop.", "gen. pop.", "gen. population", "gen population",
-        "Males and Females of any specific above criteria's", 
-        "Primary Grocery Shoppers", "grocery stores", "grocery shops", "grocery store", "grocery shop",
-        "Household Decision Makers",
-        "Those who have taken loan", "borrowed loan", "loan with", "loan",
-        "Entertainment Survey or those who like to watch TV/ Movie etc.", 
-        "Online Viewing App Subscribers/ streamers like Netflix etc.",
-        "Travellers and those who have taken flight for business or leisure",
-        "High net worth income individuals",
-        "Gamers who play online vs offline games",
-        "Music enthusiasts or music listeners/ Youtube videos",
-        "Vehicle owners or those who intend to buy a vehicle",
-        "Registered Voters",
-        "Luxury Product Buyers bags, watches etc.",
-        "Credit Card Users with Reward Programs",
-        "Smart Home Device Users (Alexa, Google Home, etc.)",
-        "Tech Enthusiasts / Early Adopters of New Gadgets",
-        "Mobile App Users (e.g., finance, health, fitness, etc.)",
-        "Food Delivery App Users (e.g., Uber Eats)", 
-        "Parents of Young Children",
-        "Pet Owners / Pet Care Buyers",
-        "Chronic Illness Patients / Caregivers",
-        "First-Time Parents or pregnant women's",
-        "College/University Students", "college student", "university student",
-    ]
-
-    b2c_matches = [kw for kw in b2c_keywords if kw.lower() in full_text.lower()]
-
-    if b2c_matches:
-        return "b2c"
-
-    b2c_keywords_2 = [  
-        "Mobile phone users",
-        "Parents of 18 YO",
-        "Feale/ Male Shoppers",
-        "Owners of PS5- gamers",
-        "Users of generative AI chatbot platforms",
-        "Music streamers – Spotify, YouTube, or Apple Music",
-        "Multiple language speakers",
-        "Leisure activity/Traverllers",
-        "Parents of kids",
-        "Vehicle owners",
-        "Intenders/purchased vehicle brand within the next 2 years",
-        "Banked individuals aged 18+",
-        "Primary Grocery Shoppers",
-        "House hold Decision makers",
-        "House hold DMs for Insurance",
-        "Homeowners",
-        "Gamers",
-        "Credit card holders",
-        "Students",
-        "Smokers",
-        "Alocohol/Drinkers",
-        "HH DMs for Baby food/milk",
-    ]
-
-    b2c_matches_2 = [kw for kw in b2c_keywords_2 if kw.lower() in full_text.lower()]
-
-    if b2c_matches_2:
-        return "b2c"
-
-    # dm_keywords = ["decision maker", "decision makers", "decision-makers", "decision-maker", "DM" , "DMs", "decisionmaker", "decisionmakers"]
-    # dm_matches = [kw for kw in dm_keywords if kw.lower() in full_text.lower()]
-
-    # if dm_matches:
-    #     matches.add("b2b")    
-
-    return "b2c" 
-
-
 def is_acuity(full_text):
 
     keywords = ["acuity"]
@@ -1738,6 +1600,11 @@ def handle_mail(email):
                            final_cpi=final_cpi, table_data_list = table_data )
 
 
+metrics.describe("predictcpi_emails_ingested_total", "Emails fetched from Graph and handled by ReadEmailAPIView.")
+metrics.describe("predictcpi_graph_request_seconds", "Microsoft Graph message fetch latency by status.")
+metrics.describe("predictcpi_email_handle_seconds", "Time handle_mail spends on one fetched email.")
+
+
 # Class-based view for reading emails
 @method_decorator(csrf_exempt, name='dispatch')
 class ReadEmailAPIView(APIView):
@@ -1799,11 +1666,14 @@ class ReadEmailAPIView(APIView):
                 retries = 0
                
                 while retries < max_retries:
+                    fetch_start = time.perf_counter()
                     response = requests.get(
                         next_url,
                         headers=headers,
                         params=params if next_url == email_endpoint else None
                     )
+                    metrics.observe("predictcpi_graph_request_seconds", time.perf_counter() - fetch_start,
+                                    status=str(response.status_code))
 
                     if response.status_code in [500, 504, 503]:
                         print(f"Got {response.status_code}. Retrying ({retries+1}/{max_retries})...")
@@ -1835,7 +1705,10 @@ class ReadEmailAPIView(APIView):
                 print(f"Fetched {len(emails)} emails in this batch : {datetime.now()}")
 
                 for email in emails:
+                    handle_start = time.perf_counter()
                     handle_mail(email)
+                    metrics.observe("predictcpi_email_handle_seconds", time.perf_counter() - handle_start)
+                    metrics.inc("predictcpi_emails_ingested_total")
                     
                 all_emails.extend(emails)
                 
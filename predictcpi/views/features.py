@@ -0,0 +1,55 @@
+import threading
+
+import numpy as np
+
+
+# ---------------- Consumer feature encoding ----------------
+class ConsumerFeatureEncoder:
+    """
+    Encodes (market, incidence_rate, loi_minutes) straight into the model's
+    column order, matching the training-time pandas encoding:
+    get_dummies(market, prefix='market') + numeric columns, reindexed to
+    `features` with 0 for missing columns (unknown markets encode as all-zero).
+    """
+
+    def __init__(self, features):
+        self.features = list(features)
+        self.market_cols = {f[len('market_'):]: i for i, f in enumerate(self.features) if f.startswith('market_')}
+        self.ir_col = self.features.index('incidence_rate') if 'incidence_rate' in self.features else None
+        self.loi_col = self.features.index('loi_minutes') if 'loi_minutes' in self.features else None
+        self._local = threading.local()
+
+    def _row(self):
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, len(self.features)))
+        return row
+
+    def encode(self, market, ir, loi):
+        """One input as a (1, n_features) row. The row buffer is reused per thread."""
+        row = self._row()
+        row.fill(0)
+        col = self.market_cols.get(market)
+        if col is not None:
+            row[0, col] = 1
+        if self.ir_col is not None:
+            row[0, self.ir_col] = ir
+        if self.loi_col is not None:
+            row[0, self.loi_col] = loi
+        return row
+
+    def encode_batch(self, markets, irs, lois, out=None):
+        """Many inputs as an (n, n_features) matrix, written into `out` if given."""
+        n = len(markets)
+        if out is None:
+            out = np.zeros((n, len(self.features)))
+        else:
+            out[:n].fill(0)
+        cols = np.array([self.market_cols.get(m, -1) for m in markets], dtype=np.int64)
+        known = cols >= 0
+        out[np.flatnonzero(known), cols[known]] = 1
+        if self.ir_col is not None:
+            out[:n, self.ir_col] = irs
+        if self.loi_col is not None:
+            out[:n, self.loi_col] = lois
+        return out[:n]
@@ -0,0 +1,38 @@
+import numpy as np
+
+
+# ---------------- Flattened random forest ----------------
+# Built by ml/train_model.py (build_forest_arrays): every tree's nodes are
+# concatenated into plain arrays, child indices made global, leaves marked
+# with left == -1. Saved uncompressed, so joblib can load it with mmap_mode
+# and all workers share the same page-cache pages.
+class ForestModel:
+    """
+    Predicts like the RandomForestRegressor it was flattened from: inputs are
+    compared as float32 (x <= threshold goes left) and tree outputs are summed
+    in tree order before dividing by the number of trees.
+    """
+
+    def __init__(self, arrays):
+        # np.asarray keeps memory-mapped arrays file-backed (plain ndarray views, no copy)
+        self.roots = np.asarray(arrays["roots"])
+        self.feature = np.asarray(arrays["feature"])
+        self.threshold = np.asarray(arrays["threshold"])
+        self.left = np.asarray(arrays["left"])
+        self.right = np.asarray(arrays["right"])
+        self.value = np.asarray(arrays["value"])
+        self.n_features = int(arrays["n_features"])
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.repeat(self.roots[None, :], X.shape[0], axis=0)
+        while True:
+            left = self.left[node]
+            split = left >= 0
+            if not split.any():
+                break
+            # leaves have feature -2; any column works since they stay put
+            go_left = X[rows, np.where(split, self.feature[node], 0)] <= self.threshold[node]
+            node = np.where(split, np.where(go_left, left, self.right[node]), node)
+        return self.value[node].cumsum(axis=1)[:, -1] / len(self.roots)
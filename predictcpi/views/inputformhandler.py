@@ -1,21 +1,28 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.parsers import JSONParser
+from rest_framework.permissions import SAFE_METHODS, BasePermission
 
 from django.shortcuts import render
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from .emailreader import extract_key_value_pairs, extract_final_agreed_cpi, html_to_text, extract_table_data_from_html, extract_vertical_table_data , clean_text, extract_email_metadata, save_unique_mail_in_db, SubmitTextAPI_helper
+# .emailreader (msal, bs4, pandas) is imported on first use, not at worker boot
 
 import random
 import os
-import numpy as np
-import pickle
-import pandas as pd
+import hmac
+import time
 import traceback
-from rest_framework.test import APIRequestFactory
-from .training import PredictCPI
+from .training import ARTIFACT_ROOT, price_quote, timing_path
+from .artifacts import ArtifactRegistry
+from .metrics import METRICS_DIR, metrics
+from .keywords import KeywordMatcher
+from .classification import ClassificationCache, audience_key
+from .heuristics import find_decision_maker
+from .llmclient import CircuitBreaker, CircuitOpen, LLMClient, LLMUnavailable
+from .singleflight import SingleFlight
+from .textmodel import TextModelSnapshot
 import requests
 
 @csrf_exempt
@@ -32,6 +39,17 @@ headers = {
     "Content-Type": "application/json"
 }
 
+# Mistral calls: pooled keep-alive client, seconds per attempt / per call, retries, circuit breaker
+MISTRAL_CONNECT_TIMEOUT = float(os.getenv("MISTRAL_CONNECT_TIMEOUT", "2"))
+MISTRAL_READ_TIMEOUT = float(os.getenv("MISTRAL_READ_TIMEOUT", "5"))
+MISTRAL_BUDGET = float(os.getenv("MISTRAL_BUDGET", "6"))
+MISTRAL_RETRIES = int(os.getenv("MISTRAL_RETRIES", "2"))
+MISTRAL_BREAKER_FAILURES = int(os.getenv("MISTRAL_BREAKER_FAILURES", "5"))
+MISTRAL_BREAKER_RESET = float(os.getenv("MISTRAL_BREAKER_RESET", "30"))
+mistral = LLMClient(API_URL, headers=headers, connect_timeout=MISTRAL_CONNECT_TIMEOUT,
+                    read_timeout=MISTRAL_READ_TIMEOUT, retries=MISTRAL_RETRIES, budget=MISTRAL_BUDGET,
+                    breaker=CircuitBreaker(MISTRAL_BREAKER_FAILURES, MISTRAL_BREAKER_RESET))
+
 B2C_KEYWORDS = [
     "General Population",
     "Males and Females of any specific above criteria",
@@ -109,19 +127,163 @@ B2C_KEYWORDS = [
     "HH DMs for milk",
 ]
 
+# One keyword per line; when the file exists it replaces B2C_KEYWORDS and is re-read on change
+B2C_KEYWORDS_FILE = os.getenv("B2C_KEYWORDS_FILE", "ml/b2c_keywords.txt")
+b2c_keywords = KeywordMatcher(B2C_KEYWORDS, path=B2C_KEYWORDS_FILE)
+
+# Local B2B/B2C text model from the artifact bundle (ml/train_model.py). Its answers are taken
+# from the confidence calibrated at training time (or CLASSIFY_MODEL_THRESHOLD); below it, Mistral.
+# A model trained without any trustworthy confidence (threshold None) is never used
+CLASSIFY_MODEL = os.getenv("CLASSIFY_MODEL", "1") == "1"
+CLASSIFY_MODEL_THRESHOLD = os.getenv("CLASSIFY_MODEL_THRESHOLD")
+TEXT_MODEL_FILES = {"business_text_model": "business_text_model.pkl"}
+text_model_registry = ArtifactRegistry(ARTIFACT_ROOT, TextModelSnapshot, default_files=TEXT_MODEL_FILES)
+if CLASSIFY_MODEL:
+    text_model_registry.start()
+
+# Mistral labels by normalized audience text: in-process LRU, then a table in the CLASSIFY_CACHE_DB_ALIAS
+# database (entries, seconds); the table tier stays off when that database is in-memory sqlite
+CLASSIFY_CACHE_SIZE = int(os.getenv("CLASSIFY_CACHE_SIZE", "1024"))
+CLASSIFY_CACHE_TTL = float(os.getenv("CLASSIFY_CACHE_TTL", str(30 * 86400)))
+CLASSIFY_CACHE_DB = os.getenv("CLASSIFY_CACHE_DB", "1") == "1"
+CLASSIFY_CACHE_DB_ALIAS = os.getenv("CLASSIFY_CACHE_DB_ALIAS", "default")
+# With the table tier on, worker copies revalidate against it after this many seconds
+CLASSIFY_CACHE_LOCAL_TTL = float(os.getenv("CLASSIFY_CACHE_LOCAL_TTL", "300"))
+# Busts are appended here and picked up by every worker on the host within a second
+CLASSIFY_BUST_LOG = os.getenv("CLASSIFY_BUST_LOG", os.path.join(METRICS_DIR, "classification-busts.log"))
+classification_cache = ClassificationCache(maxsize=CLASSIFY_CACHE_SIZE, ttl=CLASSIFY_CACHE_TTL,
+                                           use_db=CLASSIFY_CACHE_DB, using=CLASSIFY_CACHE_DB_ALIAS,
+                                           local_ttl=CLASSIFY_CACHE_LOCAL_TTL, bust_log=CLASSIFY_BUST_LOG)
+
+# Concurrent classifications of the same text share one Mistral call: always within a worker,
+# and across workers too with CLASSIFY_SHARED_LOCK=1 (lease lock in the cache table's database).
+# The shared lock needs the cache's db tier on a real shared database (MySQL, a file sqlite all
+# workers can reach); with the tier off (in-memory sqlite) it stays off too
+CLASSIFY_SHARED_LOCK = os.getenv("CLASSIFY_SHARED_LOCK", "0") == "1" and classification_cache.use_db
+classify_flight = SingleFlight()
+metrics.collectors.append(lambda: [
+    ("counter", "predictcpi_cache_hits_total", {"cache": "classification_local"}, classification_cache.local.hits),
+    ("counter", "predictcpi_cache_misses_total", {"cache": "classification_local"}, classification_cache.local.misses),
+    ("counter", "predictcpi_cache_hits_total", {"cache": "classification_db"}, classification_cache.db_hits),
+    ("counter", "predictcpi_cache_misses_total", {"cache": "classification_db"}, classification_cache.db_misses),
+    ("counter", "predictcpi_classify_coalesced_total", {"scope": "worker"}, classify_flight.coalesced),
+])
+
+
+metrics.describe("predictcpi_mistral_request_seconds", "Mistral API call latency by caller and outcome.")
+metrics.describe("predictcpi_business_classifications_total", "classify_business answers by method.")
+metrics.describe("predictcpi_classify_coalesced_total",
+                 "classify_business calls answered by another in-flight call for the same text.")
+metrics.describe("predictcpi_text_model_predictions_total",
+                 "Local text model predictions, by whether they were confident enough to use.")
+metrics.describe("predictcpi_text_model_loaded", "1 when a local text model is loaded.")
+metrics.describe("predictcpi_mistral_attempts_total", "HTTP attempts made to Mistral, retries included.")
+metrics.describe("predictcpi_mistral_failed_calls_total", "Mistral calls that got no answer within their latency budget.")
+metrics.describe("predictcpi_mistral_rejected_calls_total", "Mistral calls refused by the open circuit breaker.")
+metrics.describe("predictcpi_mistral_breaker_opened_total", "Times the Mistral circuit breaker opened.")
+metrics.describe("predictcpi_mistral_breaker_open", "1 while the Mistral circuit breaker is open or half-open.")
+metrics.collectors.append(lambda: [
+    ("gauge", "predictcpi_text_model_loaded", {},
+     int(text_model_registry.current is not None and text_model_registry.current.model is not None)),
+])
+metrics.collectors.append(lambda: [
+    ("counter", "predictcpi_mistral_attempts_total", {}, mistral.attempts),
+    ("counter", "predictcpi_mistral_failed_calls_total", {}, mistral.failures),
+    ("counter", "predictcpi_mistral_rejected_calls_total", {}, mistral.rejected),
+    ("counter", "predictcpi_mistral_breaker_opened_total", {}, mistral.breaker.opened),
+    ("gauge", "predictcpi_mistral_breaker_open", {}, int(mistral.breaker.state != "closed")),
+])
+
 
 def classify_business(text: str) -> str:
     """
-    Classify a company/business as B2B or B2C using Mistral API.
+    Classify a company/business as B2B or B2C using the local text model,
+    or the Mistral API when the model isn't confident.
     Always return only 'B2B', 'B2C', or 'Unknown'.
     """
     # 🔹 Step 1: Quick check against predefined B2C list
-    text_lower = text.lower()
-    for keyword in B2C_KEYWORDS:
-        if keyword.lower() in text_lower:
-            return "B2C"  # direct return, no API call
-
-    # 🔹 Step 2: If not matched, call API
+    if b2c_keywords.search(text):
+        metrics.inc("predictcpi_business_classifications_total", method="keyword")
+        return "B2C"  # direct return, no API call
+
+    # 🔹 Step 2: Local text model, when it is confident enough
+    label = text_model_label(text)
+    if label is not None:
+        metrics.inc("predictcpi_business_classifications_total", method="model")
+        return label
+
+    # 🔹 Step 3: Label cached for the same (normalized) text, no API call
+    key = audience_key(text)
+    label, tier = classification_cache.get(key)
+    if label is not None:
+        metrics.inc("predictcpi_business_classifications_total", method=f"cache_{tier}")
+        return label
+
+    # 🔹 Step 4: If not matched, call API (one call per text at a time; concurrent callers share it)
+    return classify_flight.do(key, lambda: _classify_upstream(text, key))
+
+
+def text_model_label(text):
+    """The local text model's label for `text`, or None if it has none loaded or isn't sure."""
+    snapshot = text_model_registry.snapshot() if CLASSIFY_MODEL else None
+    model = snapshot.model if snapshot is not None else None
+    if model is None or model.threshold is None:
+        # no model, or one that was never accurate enough at any confidence
+        return None
+    label, confidence = model.predict(text)
+    threshold = float(CLASSIFY_MODEL_THRESHOLD) if CLASSIFY_MODEL_THRESHOLD else model.threshold
+    confident = confidence >= threshold
+    metrics.inc("predictcpi_text_model_predictions_total", confident=str(confident).lower())
+    return label if confident else None
+
+
+def _classify_upstream(text, key):
+    """
+    Mistral's label for `text`, cached; the local heuristics if Mistral can't answer in time.
+    Either way the caller waits at most about MISTRAL_BUDGET seconds.
+    """
+    locked = False
+    if CLASSIFY_SHARED_LOCK:
+        locked = classification_cache.acquire(key, lease=MISTRAL_BUDGET + 1)
+        if not locked:
+            # another worker is asking Mistral about the same text: wait for its label, and
+            # don't start a second full-budget call if none comes in time (or the holder failed)
+            label = classification_cache.wait(key, timeout=MISTRAL_BUDGET)
+            if label is not None:
+                metrics.inc("predictcpi_classify_coalesced_total", scope="cluster")
+                return label
+            print("No label from the worker holding the Mistral lock, classifying with find_decision_maker")
+            return _heuristic_label(text)
+    try:
+        label = mistral_classify(text)
+        classification_cache.set(key, label)
+        return label
+    except (LLMUnavailable, requests.RequestException, ValueError, LookupError, TypeError) as e:
+        print(f"Mistral unavailable ({e}), classifying with find_decision_maker")
+        return _heuristic_label(text)
+    finally:
+        if locked:
+            classification_cache.release(key)
+
+
+def _heuristic_label(text):
+    metrics.inc("predictcpi_business_classifications_total", method="heuristic")
+    return find_decision_maker(text).upper()
+
+
+def _completion_text(result):
+    """The first choice's message text of a chat completion; ValueError for any other shape."""
+    try:
+        content = result["choices"][0]["message"]["content"]
+    except (LookupError, TypeError) as e:
+        raise ValueError(f"malformed Mistral answer ({type(e).__name__}: {e})") from e
+    if not isinstance(content, str):
+        raise ValueError(f"malformed Mistral answer (content {content!r})")
+    return content.strip()
+
+
+def mistral_classify(text: str) -> str:
+    """B2B / B2C label for `text` from the Mistral chat API (B2B when the answer is neither)."""
     prompt = f"""
     You are an expert at classifying businesses.
     Given the description below, classify the business strictly as one of:
@@ -142,12 +304,25 @@ def classify_business(text: str) -> str:
         "temperature": 0.0,
     }
 
-    response = requests.post(API_URL, headers=headers, json=payload)
-    response.raise_for_status()
-    result = response.json()
-    output = result["choices"][0]["message"]["content"].strip()
-
-    # 🔹 Step 3: Post-process to ensure valid output
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        result = mistral.post_json(payload)
+        outcome = "malformed"
+        output = _completion_text(result)
+        outcome = "ok"
+    except CircuitOpen:
+        outcome = "rejected"
+        raise
+    except LLMUnavailable:
+        outcome = "unavailable"
+        raise
+    finally:
+        metrics.observe("predictcpi_mistral_request_seconds", time.perf_counter() - start,
+                        caller="classify_business", outcome=outcome)
+    metrics.inc("predictcpi_business_classifications_total", method="mistral")
+
+    # Post-process to ensure valid output
     if output.upper().startswith("B2B"):
         return "B2B"
     elif output.upper().startswith("B2C"):
@@ -209,6 +384,7 @@ class SubmitTextAPI(APIView):
                 }, status=400)
 
 
+            from .emailreader import SubmitTextAPI_helper
             extracted_data = SubmitTextAPI_helper(user_text)
             # print("!!!!!!!!!!",extracted_data)
             master_data=extracted_data["html_data"]
@@ -229,17 +405,16 @@ class SubmitTextAPI(APIView):
                 business_type = classify_business(audience_text)
             master_data["business_type"]  = business_type
 
-             # Predict CPI
-            factory = APIRequestFactory()
-            internal_request = factory.post('/predict-cpi/', master_data, format='json')
-            response = PredictCPI.as_view()(internal_request)
+             # Predict CPI (same pricing as /predict-cpi/, no internal HTTP round trip)
+            quote, status_code = price_quote(master_data)
+            metrics.inc("predictcpi_quotes_total", endpoint="submit_text", source=timing_path(quote, status_code))
 
         
             return Response({
                 "status": "success",
                 "structured_data": master_data,
                 "business_type": business_type,
-                "message": response.data,
+                "message": quote,
             })
 
         except Exception as e:
@@ -253,3 +428,43 @@ class SubmitTextAPI(APIView):
             }, status=400)
             
 
+
+# Shared secret for changing the classification cache (X-Admin-Token header); unset: staff users only
+CLASSIFY_CACHE_ADMIN_TOKEN = os.getenv("CLASSIFY_CACHE_ADMIN_TOKEN", "")
+
+
+class IsCacheAdmin(BasePermission):
+    """Reads for anyone; writes for staff users or requests carrying CLASSIFY_CACHE_ADMIN_TOKEN."""
+
+    def has_permission(self, request, view):
+        if request.method in SAFE_METHODS or (request.user and request.user.is_staff):
+            return True
+        token = request.headers.get("X-Admin-Token", "")
+        return bool(CLASSIFY_CACHE_ADMIN_TOKEN) and hmac.compare_digest(token, CLASSIFY_CACHE_ADMIN_TOKEN)
+
+
+class ClassificationCacheAPI(APIView):
+    """
+    GET: hit counters of the classify_business cache.
+    DELETE {"text": ...}: forget the label cached for that audience text;
+    {"all": true} forgets every label. DELETE needs IsCacheAdmin. Other workers
+    on the host drop their copies within a second; other hosts (db tier only)
+    within CLASSIFY_CACHE_LOCAL_TTL.
+    """
+
+    parser_classes = [JSONParser]
+    permission_classes = [IsCacheAdmin]
+
+    def get(self, request):
+        return Response(classification_cache.stats())
+
+    def delete(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        text = data.get("text")
+        if text:
+            removed = classification_cache.bust(audience_key(text))
+        elif data.get("all") is True:
+            removed = classification_cache.bust()
+        else:
+            return Response({"status": "error", "message": 'Send {"text": ...} or {"all": true}'}, status=400)
+        return Response({"status": "success", "removed": removed})
@@ -0,0 +1,100 @@
+import os
+import re
+import time
+
+
+# ---------------- Keyword matcher ----------------
+def _trie_regex(keywords):
+    """
+    One regex for "any of `keywords`" with shared prefixes factored out
+    ('pet owners|pet care' -> 'pet\\ (?:owners|care)'), so each text position
+    walks a trie instead of trying every keyword. Keywords must not contain
+    one another (see KeywordMatcher._compile).
+    """
+    trie = {}
+    for word in keywords:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        if "" in node:
+            return ""
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return re.compile(build(trie))
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive substring search for a keyword list, in one pass over
+    the text: `search(text)` is true exactly when `kw.lower() in text.lower()`
+    for some keyword, and its cost hardly grows with the number of keywords.
+
+    With `path`, the list comes from that file (one keyword per line, blank
+    lines and '#' comments skipped) instead of `defaults`, and is re-read when
+    the file changes, checked at most once per `check_interval` seconds.
+    Without the file, `defaults` are used.
+    """
+
+    def __init__(self, defaults, path=None, check_interval=5.0):
+        self.defaults = list(defaults)
+        self.path = path
+        self.check_interval = check_interval
+        self.checked_at = 0.0
+        self.signature = None
+        self.keywords = []
+        self._pattern = None
+        self._load()
+
+    def _stat(self):
+        if not self.path:
+            return None
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read(self):
+        with open(self.path, encoding="utf-8") as fh:
+            lines = (line.strip() for line in fh)
+            return [line for line in lines if line and not line.startswith("#")]
+
+    def _compile(self, keywords):
+        words = sorted({k.lower() for k in keywords if k})
+        # a keyword containing another one can never decide a match on its own
+        words = [w for w in words if not any(o != w and o in w for o in words)]
+        return _trie_regex(words) if words else None
+
+    def _load(self):
+        signature = self._stat()
+        keywords = self.defaults
+        if signature is not None:
+            try:
+                keywords = self._read()
+            except (OSError, UnicodeDecodeError) as e:
+                print(f"keyword file {self.path} unreadable, keeping current list: {e}")
+                return
+        self._pattern = self._compile(keywords)
+        self.keywords = keywords
+        self.signature = signature
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self.checked_at < self.check_interval:
+            return
+        self.checked_at = now
+        if self._stat() != self.signature:
+            self._load()
+
+    def search(self, text):
+        """The first keyword occurrence in `text` (lowercased), or None."""
+        self._maybe_reload()
+        pattern = self._pattern
+        if pattern is None:
+            return None
+        match = pattern.search(str(text).lower())
+        return match.group(0) if match else None
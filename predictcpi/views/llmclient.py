@@ -0,0 +1,167 @@
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError, ReadTimeoutError
+
+
+class LLMUnavailable(Exception):
+    """No answer within the latency budget: circuit open, timeouts, or upstream errors."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Refused without a network call: the upstream failed too often recently."""
+
+
+# ---------------- Circuit breaker ----------------
+class CircuitBreaker:
+    """
+    closed:    calls go through; `failures` consecutive failed calls open it
+    open:      calls are refused for `reset_after` seconds
+    half_open: then one trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failures=5, reset_after=30.0):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_after:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# ---------------- Pooled JSON client ----------------
+class LLMClient:
+    """
+    POSTs JSON to one chat-completions endpoint over a keep-alive connection
+    pool, bounded in time: every call gets at most `budget` seconds, each
+    attempt `connect_timeout` / `read_timeout` (cut to what is left of the
+    budget). Connection errors, timeouts, 429 and 5xx are retried up to
+    `retries` times with jittered exponential backoff; other 4xx raise
+    requests.HTTPError straight away. Calls that still fail, or that the
+    circuit breaker refuses, raise LLMUnavailable.
+
+    The budget is best-effort: socket timeouts bound each wait for bytes,
+    not a whole attempt, so the deadline is also checked once the headers
+    are in and between body chunks. A server trickling bytes overruns it by
+    at most one socket wait.
+    """
+
+    RETRY_STATUS = frozenset({429, 500, 502, 503, 504})
+    CHUNK_SIZE = 8192
+
+    def __init__(self, url, headers=None, connect_timeout=2.0, read_timeout=5.0, retries=2,
+                 backoff=0.25, budget=6.0, breaker=None, pool_size=10):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.budget = budget
+        self.breaker = breaker or CircuitBreaker()
+        self.pool_size = pool_size
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.session = self._new_session()
+        if hasattr(os, "register_at_fork"):
+            # a forked worker must not share the parent's sockets
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers.update(self.headers)
+        return session
+
+    def _after_fork_in_child(self):
+        self.session = self._new_session()
+
+    def _attempt(self, payload, deadline):
+        """(response json, None) or (None, reason) for a retryable failure."""
+        remaining = deadline - time.monotonic()
+        timeout = (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+        try:
+            response = self.session.post(self.url, json=payload, timeout=timeout, stream=True)
+        except requests.Timeout:
+            return None, "timeout"
+        except requests.ConnectionError:
+            return None, "connection"
+        with response:
+            if response.status_code in self.RETRY_STATUS:
+                return None, f"http {response.status_code}"
+            response.raise_for_status()
+            if time.monotonic() >= deadline:
+                return None, "timeout"
+            body = []
+            try:
+                # read1, not iter_content: that blocks until a whole chunk is in
+                while chunk := response.raw.read1(self.CHUNK_SIZE, decode_content=True):
+                    body.append(chunk)
+                    if time.monotonic() >= deadline:
+                        return None, "timeout"
+            except ReadTimeoutError:
+                return None, "timeout"
+            except (ProtocolError, OSError):
+                return None, "connection"
+        return json.loads(b"".join(body)), None
+
+    def post_json(self, payload):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen("circuit open")
+        self.calls += 1
+        deadline = time.monotonic() + self.budget
+        reason = "budget exhausted"
+        for attempt in range(self.retries + 1):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.attempts += 1
+            try:
+                result, reason = self._attempt(payload, deadline)
+            except Exception:
+                # not an outage (bad request, bad JSON): don't hold it against the upstream
+                self.breaker.record_success()
+                raise
+            if reason is None:
+                self.breaker.record_success()
+                return result
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                time.sleep(max(0.0, min(delay, deadline - time.monotonic())))
+        self.failures += 1
+        self.breaker.record_failure()
+        raise LLMUnavailable(reason)
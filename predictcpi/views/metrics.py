@@ -0,0 +1,290 @@
+import atexit
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+# ---------------- Multiprocess metrics ----------------
+# Each process (gunicorn worker) keeps its own counters, histograms and gauges
+# and a background thread writes them every METRICS_FLUSH_INTERVAL seconds to
+# <METRICS_DIR>/metrics-<pid>.json (tmp file + os.replace, so a reader never
+# sees half a file). /metrics merges every file in the directory:
+#   counters, histograms: summed over all processes, exited workers included
+#   gauges: one series per live process, labelled with its pid
+# Files of dead processes are removed when this module is first imported (the
+# master, under --preload), so a restart starts from zero.
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "predictcpi-metrics"))
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Prometheus-style metrics shared between processes through a directory.
+
+    - inc(name, value=1, **labels): counter
+    - observe(name, seconds, **labels): histogram (fixed `buckets`, in seconds)
+    - set(name, value, **labels): gauge
+    - collectors: callables returning [(kind, name, labels, value)] read at every
+      flush, for values another object already keeps (cache hit counts, ...)
+    - ratio(name, numerator, denominator): derived gauge numerator / (numerator + denominator)
+      per label set, computed on the merged counters
+
+    `render()` returns the Prometheus text format for all processes.
+    """
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, directory, flush_interval=1.0, buckets=BUCKETS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.help = {}
+        self.ratios = []
+        self.collectors = []
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._baseline = {}
+        self._flusher_pid = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+        atexit.register(self.flush)
+
+    # -------- recording --------
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def ratio(self, name, numerator, denominator, text=None):
+        self.ratios.append((name, numerator, denominator))
+        if text:
+            self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            entry = self._histograms.get(key)
+            if entry is None:
+                # counts per bucket (+Inf last), then count, sum
+                entry = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0, 0.0]
+            entry[bisect.bisect_left(self.buckets, seconds)] += 1
+            entry[-2] += 1
+            entry[-1] += seconds
+
+    def set(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._gauges[key] = value
+
+    # -------- per-process file --------
+    def _path(self, pid):
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def _collected(self):
+        samples = []
+        for collector in self.collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"metrics collector failed: {e}")
+        return samples
+
+    def flush(self):
+        """Write this process's metrics to its file."""
+        collected = self._collected()
+        with self._lock:
+            data = {
+                "counter": [[n, l, v] for (n, l), v in self._counters.items()],
+                "histogram": [[n, l, list(v)] for (n, l), v in self._histograms.items()],
+                "gauge": [[n, l, v] for (n, l), v in self._gauges.items()],
+            }
+        for kind, name, labels, value in collected:
+            labels = sorted(labels.items())
+            if kind == "counter":
+                value -= self._baseline.get((name, tuple(labels)), 0)
+            data[kind].append([name, labels, value])
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(os.getpid())
+            tmp = f"{path}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"metrics flush failed: {e}")
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def start(self):
+        """Start this process's flush thread (no-op if it is running)."""
+        if self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def prune(self):
+        """Remove the files of processes that are no longer running."""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            pid = self._file_pid(name)
+            if pid is not None and not _pid_alive(pid):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def _file_pid(self, name):
+        if not (name.startswith("metrics-") and name.endswith(".json")):
+            return None
+        try:
+            return int(name[len("metrics-"):-len(".json")])
+        except ValueError:
+            return None
+
+    def _after_fork_in_child(self):
+        # the lock may have been held by a parent thread; the parent's counts stay in
+        # the parent's file, gauges (artifact version, ...) carry over
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        # collected counters (cache hits, ...) are inherited too: count from here on
+        self._baseline = {
+            (name, tuple(sorted(labels.items()))): value
+            for kind, name, labels, value in self._collected() if kind == "counter"
+        }
+        if self._flusher_pid is not None:
+            self.start()
+
+    # -------- merged view --------
+    def collect(self):
+        """Merge every process's file: {kind: {(name, labels): value}}."""
+        self.flush()
+        merged = {"counter": {}, "histogram": {}, "gauge": {}}
+        try:
+            names = sorted(os.listdir(self.directory))
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            pid = self._file_pid(name)
+            if pid is None:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as fh:
+                    data = json.load(fh)
+            except (OSError, ValueError):
+                continue
+            for metric, labels, value in data.get("counter", ()):
+                key = (metric, tuple(map(tuple, labels)))
+                merged["counter"][key] = merged["counter"].get(key, 0) + value
+            for metric, labels, entry in data.get("histogram", ()):
+                key = (metric, tuple(map(tuple, labels)))
+                total = merged["histogram"].get(key)
+                merged["histogram"][key] = entry if total is None else [a + b for a, b in zip(total, entry)]
+            if _pid_alive(pid):
+                for metric, labels, value in data.get("gauge", ()):
+                    key = (metric, tuple(sorted(map(tuple, labels + [["pid", str(pid)]]))))
+                    merged["gauge"][key] = value
+
+        for name, numerator, denominator in self.ratios:
+            counters = merged["counter"]
+            for (metric, labels), hits in list(counters.items()):
+                if metric != numerator:
+                    continue
+                total = hits + counters.get((denominator, labels), 0)
+                merged["gauge"][(name, labels)] = hits / total if total else 0.0
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        merged = self.collect()
+        lines = []
+        for kind in ("counter", "gauge", "histogram"):
+            by_name = {}
+            for (name, labels), value in merged[kind].items():
+                by_name.setdefault(name, []).append((labels, value))
+            for name in sorted(by_name):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(by_name[name]):
+                    if kind != "histogram":
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                        continue
+                    cumulative = 0
+                    for le, n in zip(self.buckets + ("+Inf",), value):
+                        cumulative += n
+                        bucket_labels = labels + (("le", str(le)),)
+                        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-1])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {value[-2]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry(METRICS_DIR, METRICS_FLUSH_INTERVAL)
+metrics.prune()
+metrics.start()
+
+metrics.describe("predictcpi_http_requests_total", "HTTP requests by route, method and status.")
+metrics.describe("predictcpi_http_request_seconds", "HTTP request latency by route and method.")
+
+
+# ---------------- Request middleware ----------------
+class RequestMetricsMiddleware:
+    """Counts and times every request by URL route (the urls.py pattern, not the raw path)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, "resolver_match", None)
+        route = "/" + match.route if match is not None else "unmatched"
+        metrics.inc("predictcpi_http_requests_total", route=route, method=request.method,
+                    status=str(response.status_code))
+        metrics.observe("predictcpi_http_request_seconds", time.perf_counter() - start,
+                        route=route, method=request.method)
+        return response
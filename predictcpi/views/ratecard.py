@@ -0,0 +1,185 @@
+import numpy as np
+
+
+# ---------------- Band index ----------------
+class BandIndex:
+    """
+    One country's LOI/IR rate card stored column-wise: int32 arrays for the
+    band edges, float64 for price (plus the raw country name per band), so
+    a band costs ~24 bytes instead of a ~400 byte dict.
+
+    - cover: boolean mask of the bands containing the query range; first hit.
+    - nearest: L1 distance from the query midpoint to every band center;
+      argmin keeps the first band at minimum distance.
+
+    Both return the band's position; `row(pos)` builds the dict form (same
+    keys and values as the rate card row) only for the band that matched.
+    """
+
+    COLUMNS = ('loi_min', 'loi_max', 'incidence_min', 'incidence_max')
+
+    def __init__(self, rows):
+        rows = list(rows)
+        self.country_name = [r.get('country_name') for r in rows]
+        self.loi_min, self.loi_max, self.incidence_min, self.incidence_max = (
+            np.array([r[c] for r in rows], dtype=np.int32) for c in self.COLUMNS
+        )
+        self.price = np.array([r['price'] for r in rows], dtype=np.float64)
+        self.loi_center = (self.loi_min.astype(np.float64) + self.loi_max) / 2
+        self.ir_center = (self.incidence_min.astype(np.float64) + self.incidence_max) / 2
+
+    def __len__(self):
+        return len(self.price)
+
+    def __bool__(self):
+        return len(self.price) > 0
+
+    def row(self, pos):
+        return {
+            'country_name': self.country_name[pos],
+            'loi_min': int(self.loi_min[pos]),
+            'loi_max': int(self.loi_max[pos]),
+            'incidence_min': int(self.incidence_min[pos]),
+            'incidence_max': int(self.incidence_max[pos]),
+            'price': float(self.price[pos]),
+        }
+
+    def cover(self, loi_range, ir_range):
+        Lmin, Lmax = loi_range
+        Imin, Imax = ir_range
+        hit = (self.loi_min <= Lmin) & (self.loi_max >= Lmax) & \
+              (self.incidence_min <= Imin) & (self.incidence_max >= Imax)
+        if not hit.any():
+            return None
+        return int(hit.argmax())
+
+    def nearest(self, loi_range, ir_range):
+        if not len(self.price):
+            return None
+        Lmid = (loi_range[0] + loi_range[1]) / 2
+        Imid = (ir_range[0] + ir_range[1]) / 2
+        return int((np.abs(Lmid - self.loi_center) + np.abs(Imid - self.ir_center)).argmin())
+
+    # (ir, loi, band) cells per sweep block: bounds the temporaries at ~10 MB whatever the card size
+    SWEEP_BLOCK = 1 << 20
+
+    def sweep(self, loi_ranges, ir_ranges):
+        """
+        cover-else-nearest for every (ir, loi) pair of two axes of ranges, in
+        (rows, n_loi, n_bands) blocks of IR rows sized by SWEEP_BLOCK.
+        Returns (positions, covered), both (n_ir, n_loi).
+        """
+        Lmin, Lmax = (np.array(v, dtype=np.float64)[None, :, None] for v in zip(*loi_ranges))
+        Imin_all, Imax_all = (np.array(v, dtype=np.float64)[:, None, None] for v in zip(*ir_ranges))
+        n_ir, n_loi = len(ir_ranges), len(loi_ranges)
+        positions = np.empty((n_ir, n_loi), dtype=np.int64)
+        covered = np.empty((n_ir, n_loi), dtype=bool)
+        loi_hit = (self.loi_min <= Lmin) & (self.loi_max >= Lmax)
+        loi_dist = np.abs((Lmin + Lmax) / 2 - self.loi_center)
+        rows = max(1, self.SWEEP_BLOCK // max(1, n_loi * len(self.price)))
+        for r in range(0, n_ir, rows):
+            Imin, Imax = Imin_all[r:r + rows], Imax_all[r:r + rows]
+            hit = loi_hit & (self.incidence_min <= Imin) & (self.incidence_max >= Imax)
+            block_covered = hit.any(axis=2)
+            dist = loi_dist + np.abs((Imin + Imax) / 2 - self.ir_center)
+            positions[r:r + rows] = np.where(block_covered, hit.argmax(axis=2), dist.argmin(axis=2))
+            covered[r:r + rows] = block_covered
+        return positions, covered
+
+
+def build_band_indexes(rows_by_name):
+    """Build a BandIndex per country/region from a {name: [rows]} mapping."""
+    return {name: BandIndex(rows) for name, rows in rows_by_name.items()}
+
+
+# ---------------- Client names ----------------
+def levenshtein(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+class QGramIndex:
+    """
+    Names indexed by padded character 3-grams and by length, for "every name
+    within k edits" without an edit distance per name: one edit destroys at
+    most 3 of a name's 3-grams, so a match shares at least
+    len(distinct grams of the query) - 3k of them and differs in length by at
+    most k. Only those candidates get a Levenshtein.
+    """
+
+    Q = 3
+
+    def __init__(self, words=()):
+        self.words = []
+        self.postings = {}
+        self.by_length = {}
+        for w in words:
+            self.add(w)
+
+    @classmethod
+    def grams(cls, word):
+        padded = "\0" * (cls.Q - 1) + word + "\0" * (cls.Q - 1)
+        return {padded[i:i + cls.Q] for i in range(len(padded) - cls.Q + 1)}
+
+    def add(self, word):
+        wid = len(self.words)
+        self.words.append(word)
+        for g in self.grams(word):
+            self.postings.setdefault(g, []).append(wid)
+        self.by_length.setdefault(len(word), []).append(wid)
+
+    def search(self, word, max_dist):
+        """Return [(distance, name)] for every name within `max_dist` edits."""
+        grams = self.grams(word)
+        need = len(grams) - self.Q * max_dist
+        lengths = range(len(word) - max_dist, len(word) + max_dist + 1)
+        if need <= 0:
+            # too short for the gram filter to exclude anything: length filter only
+            candidates = [wid for n in lengths for wid in self.by_length.get(n, ())]
+        else:
+            counts = {}
+            for g in grams:
+                for wid in self.postings.get(g, ()):
+                    counts[wid] = counts.get(wid, 0) + 1
+            candidates = [wid for wid, c in counts.items() if c >= need and len(self.words[wid]) in lengths]
+        found = []
+        for wid in candidates:
+            d = levenshtein(word, self.words[wid])
+            if d <= max_dist:
+                found.append((d, self.words[wid]))
+        return found
+
+
+class ClientIndex:
+    """Client rate rows keyed by normalized client name, with a 3-gram index for near misses."""
+
+    def __init__(self, records):
+        by_client = {}
+        for r in records:
+            by_client.setdefault(normalize_client_name(r["client_name"]), r)
+        self.by_client = by_client
+        self.order = {name: pos for pos, name in enumerate(by_client)}
+        self.names = QGramIndex(by_client)
+
+    def get(self, client_name, max_typos=0):
+        """Exact match first; otherwise the closest name within `max_typos` edits (first in table on ties)."""
+        name = normalize_client_name(client_name)
+        matched = self.by_client.get(name)
+        if matched is not None or max_typos <= 0:
+            return matched
+        hits = self.names.search(name, max_typos)
+        if not hits:
+            return None
+        _, best = min(hits, key=lambda h: (h[0], self.order[h[1]]))
+        return self.by_client[best]
+
+
+def normalize_client_name(name):
+    return str(name).lower().strip()
@@ -0,0 +1,74 @@
+import math
+import re
+import zlib
+
+import numpy as np
+
+
+# ---------------- Hashed n-gram features ----------------
+# ml/train_model.py loads this file by path and trains on these very features, so
+# keep it free of Django and package-relative imports. FEATURIZER names the
+# encoding; bump it on any change: a model trained with another one is not loaded.
+FEATURIZER = "words12-chars3-crc32-l2/1"
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def business_text_features(text, n_features):
+    """
+    {bucket: weight} for `text`: word unigrams and bigrams plus character
+    3-grams of each word ('<pet>' -> '<pe', 'pet', 'et>'), hashed with crc32
+    into `n_features` buckets, counts scaled to unit L2 norm.
+    """
+    tokens = TOKEN_RE.findall(str(text or "").lower())
+    grams = tokens + [a + " " + b for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = "<" + token + ">"
+        grams.extend("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+
+    counts = {}
+    for gram in grams:
+        bucket = zlib.crc32(gram.encode("utf-8")) % n_features
+        counts[bucket] = counts.get(bucket, 0) + 1
+    norm = math.sqrt(sum(c * c for c in counts.values())) or 1.0
+    return {bucket: c / norm for bucket, c in counts.items()}
+
+
+# ---------------- Linear model ----------------
+class BusinessTextModel:
+    """
+    Logistic regression over business_text_features, flattened by
+    ml/train_model.py (train_business_text) into plain arrays, so serving
+    needs neither sklearn nor scipy. `predict(text)` gives (label, confidence)
+    with confidence the model's probability of that label; `threshold` (None:
+    no confidence was accurate enough, so the model is never trusted) is the
+    confidence from which its answers were as accurate as asked for on the
+    held-out RFQs at training time.
+    """
+
+    def __init__(self, arrays):
+        if arrays.get("featurizer") != FEATURIZER:
+            raise ValueError(f"text model featurizer {arrays.get('featurizer')!r}, expected {FEATURIZER!r}")
+        self.n_features = int(arrays["n_features"])
+        self.coef = np.asarray(arrays["coef"], dtype=np.float64)
+        self.intercept = float(arrays["intercept"])
+        self.classes = tuple(arrays["classes"])
+        threshold = arrays["threshold"]
+        self.threshold = float(threshold) if threshold is not None else None
+        self.trained_on = int(arrays.get("trained_on", 0))
+
+    def predict(self, text):
+        features = business_text_features(text, self.n_features)
+        score = self.intercept + sum(self.coef[bucket] * weight for bucket, weight in features.items())
+        # P(classes[1]), clipped so exp can't overflow
+        p = 1.0 / (1.0 + math.exp(-max(-500.0, min(500.0, score))))
+        return (self.classes[1], p) if p >= 0.5 else (self.classes[0], 1.0 - p)
+
+
+class TextModelSnapshot:
+    """ArtifactRegistry build for the text model bundle entry; `model` None when the bundle has none."""
+
+    def __init__(self, artifacts):
+        self.version = None
+        self.complete = True
+        arrays = artifacts.get("business_text_model")
+        self.model = BusinessTextModel(arrays) if arrays is not None else None
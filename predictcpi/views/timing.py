@@ -0,0 +1,145 @@
+import bisect
+import threading
+import time
+
+
+# ---------------- Stage timers ----------------
+# `with request_timer(enabled) as timer:` makes `timer` the active recorder for
+# this thread; `with stage("parse"):` anywhere below adds its elapsed
+# (monotonic) time to it. Without an active timer `stage` hands back one
+# shared no-op context, so the instrumented code costs a thread-local read.
+class _Local(threading.local):
+    timer = None  # class default: reading it in a thread that never set it is a plain lookup
+
+
+_local = _Local()
+
+
+class StageTimer:
+    """
+    Elapsed seconds per stage name (repeated stages add up), in first-seen order,
+    plus `marks`: names flagged with `mark` while it was active (e.g. 'cache_hit').
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.marks = set()
+        self.start = time.perf_counter()
+        self.total = None
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def items(self):
+        """(stage, seconds) pairs, ending with 'total'."""
+        return list(self.stages.items()) + [("total", self.total)]
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds."""
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.items())
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+
+
+class _NoStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+NO_STAGE = _NoStage()
+
+
+def stage(name):
+    timer = _local.timer
+    return NO_STAGE if timer is None else _Stage(timer, name)
+
+
+def mark(name):
+    timer = _local.timer
+    if timer is not None:
+        timer.marks.add(name)
+
+
+class request_timer:
+    """Context manager yielding the active StageTimer, or None when disabled."""
+
+    def __init__(self, enabled=True):
+        self.timer = StageTimer() if enabled else None
+
+    def __enter__(self):
+        if self.timer is not None:
+            _local.timer = self.timer
+        return self.timer
+
+    def __exit__(self, *exc):
+        if self.timer is not None:
+            self.timer.finish()
+            _local.timer = None
+
+
+# ---------------- Latency histograms ----------------
+class LatencyHistograms:
+    """
+    Fixed-bucket latency histograms per (path, stage), in milliseconds.
+    `observe` takes a finished StageTimer; `snapshot` gives cumulative bucket counts.
+    """
+
+    BUCKETS_MS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+    def __init__(self, buckets_ms=BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def observe(self, path, timer):
+        with self._lock:
+            for name, seconds in timer.items():
+                ms = seconds * 1000
+                entry = self._data.get((path, name))
+                if entry is None:
+                    # counts per bucket (+Inf last), then count, sum
+                    entry = self._data[(path, name)] = [0] * (len(self.buckets_ms) + 1) + [0, 0.0]
+                entry[bisect.bisect_left(self.buckets_ms, ms)] += 1
+                entry[-2] += 1
+                entry[-1] += ms
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self):
+        """{path: {stage: {"count", "sum_ms", "buckets": {le: cumulative count}}}}"""
+        with self._lock:
+            data = {key: list(entry) for key, entry in self._data.items()}
+        report = {}
+        for (path, name), entry in sorted(data.items()):
+            cumulative, buckets = 0, {}
+            for le, n in zip(self.buckets_ms + ("+Inf",), entry):
+                cumulative += n
+                buckets[str(le)] = cumulative
+            report.setdefault(path, {})[name] = {
+                "count": entry[-2],
+                "sum_ms": round(entry[-1], 4),
+                "buckets": buckets,
+            }
+        return report
@@ -1,23 +1,58 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-import pandas as pd
-import joblib
-import re, os, bisect
+from django.http import HttpResponse
+import numpy as np
+import re, os, bisect, time
 from math import ceil
+from numbers import Integral
 from collections import defaultdict
+from functools import lru_cache
 import re
 from .countries import countries
+from .artifacts import ArtifactRegistry
+from .cache import TTLCache
+from .features import ConsumerFeatureEncoder
+from .forest import ForestModel
+from .metrics import CONTENT_TYPE, metrics
+from .ratecard import build_band_indexes, ClientIndex, normalize_client_name
+from .timing import LatencyHistograms, mark, request_timer, stage
 
 
 # ---------------- Paths ----------------
-CONSUMER_MODEL = "ml/consumer_pricing_model.pkl"
-CONSUMER_FEATURES = "ml/consumer_pricing_features.pkl"
-CONSUMER_LOOKUP = "ml/consumer_pricing_lookup.pkl"
-CONSUMER_BUCKETS = "ml/consumer_pricing_buckets.pkl"
-B2B_LOOKUP = "ml/qlab_b2b_pricing_lookup.pkl"
-B2B_ACQUITY_LOOKUP = "ml/b2b_cpi_pricing_acquity_lookup.pkl"
-B2C_ACQUITY_LOOKUP = "ml/b2c_cpi_pricing_acquity_lookup.pkl"
+# Pricing artifacts are read as one versioned bundle (see artifacts.py / ml/train_model.py)
+ARTIFACT_ROOT = "ml"
+# name -> file: the artifacts the API loads (others in a bundle are skipped); file names are
+# only used for a bundle without manifest.json
+ARTIFACT_FILES = {
+    "consumer_forest": "consumer_pricing_forest.pkl",
+    "consumer_features": "consumer_pricing_features.pkl",
+    "consumer_lookup": "consumer_pricing_lookup.pkl",
+    "consumer_buckets": "consumer_pricing_buckets.pkl",
+    "consumer_grid": "consumer_pricing_grid.pkl",
+    "consumer_model_table": "consumer_pricing_model_table.pkl",
+    "b2b_lookup": "qlab_b2b_pricing_lookup.pkl",
+    "acuity_b2b_lookup": "acuity_b2b_pricing_lookup.pkl",
+    "acuity_b2c_lookup": "acuity_b2c_pricing_lookup.pkl",
+    "b2b_client_lookup": "b2b_with_client_pricing_lookup.pkl",
+}
+# Loaded file-backed (mmap_mode='r'): with `gunicorn --preload` all workers share these pages
+MMAP_ARTIFACTS = ("consumer_forest",)
+# Loaded (and served from) first at boot; the consumer forest follows
+LOOKUP_ARTIFACTS = tuple(name for name in ARTIFACT_FILES if name != "consumer_forest")
+
+# Seconds a request waits for the first pricing snapshot of a booting worker before a 503
+PRICING_LOAD_WAIT = float(os.getenv("PRICING_LOAD_WAIT", "10"))
+
+# Response cache for repeated quotes (entries, seconds); size 0 disables
+PRICE_CACHE_SIZE = int(os.getenv("PRICE_CACHE_SIZE", "4096"))
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "300"))
+
+# Per-stage timers on /predict-cpi/ (Server-Timing header + per-path histograms); 0 disables
+PRICE_STAGE_TIMING = os.getenv("PRICE_STAGE_TIMING", "1") == "1"
+
+# Opt-in typo tolerance for client names (edits allowed, also capped at len(name)//4); 0 disables
+CLIENT_NAME_MAX_TYPOS = int(os.getenv("CLIENT_NAME_MAX_TYPOS", "0"))
 
 
 # ---------------- USA synonyms (normalized to uppercase, dots removed) ----------------
@@ -84,82 +119,94 @@ COUNTRY_SYNONYMS = {
 
 }
 
+def _clean_country_or_market(name: str) -> str:
+    """Trim, uppercase, collapse spaces, turn dots and dashes into spaces."""
+    s = " ".join((name or "").upper().replace(".", " ").split())
+    return s.replace("-", " ").strip()
+
+# Every synonym, cleaned the same way as the input, -> canonical name (first set wins)
+SYNONYM_TO_CANONICAL = {}
+for _canonical, _synonyms in COUNTRY_SYNONYMS.items():
+    for _synonym in _synonyms:
+        SYNONYM_TO_CANONICAL.setdefault(_clean_country_or_market(_synonym), _canonical)
+
+@lru_cache(maxsize=4096)
 def _normalize_country_or_market(name: str) -> str:
     """
     Normalize country/market to canonical form.
     - Trim, uppercase, collapse spaces, remove dots
     - Map any synonym to its canonical name
     """
-    s = (name or "").upper()
-    s = s.replace(".", " ").strip()
-    s = re.sub(r"\s+", " ", s)  # collapse multiple spaces
-    s = s.replace("-", " ").strip()
-
-    # lookup in COUNTRY_SYNONYMS
-    for canonical, synonyms in COUNTRY_SYNONYMS.items():
-        if s in synonyms:
-            return canonical
-
-    return s  # fallback (unchanged if no match)
-
-# ---------------- Load consumer artifacts ----------------
-if os.path.exists(CONSUMER_MODEL):
-    consumer_model = joblib.load(CONSUMER_MODEL)
-    consumer_features = joblib.load(CONSUMER_FEATURES)
-    consumer_lookup = joblib.load(CONSUMER_LOOKUP)
-    consumer_buckets = joblib.load(CONSUMER_BUCKETS)
-    ir_buckets = consumer_buckets.get('ir_buckets', [])
-    loi_buckets = consumer_buckets.get('loi_buckets', [])
-else:
-    consumer_model, consumer_features, consumer_lookup = None, [], {}
-    ir_buckets, loi_buckets = [], []
-
-# ---------------- Load B2B lookup ----------------
-raw_b2b = joblib.load(B2B_LOOKUP) if os.path.exists(B2B_LOOKUP) else []
-
-raw_b2b_acquity = joblib.load(B2B_ACQUITY_LOOKUP) if os.path.exists(B2B_ACQUITY_LOOKUP) else []
-raw_b2c_acquity = joblib.load(B2C_ACQUITY_LOOKUP) if os.path.exists(B2C_ACQUITY_LOOKUP) else []
-
-by_name_b2b_acquity = defaultdict(list)
-for r in raw_b2b_acquity:
-    cn_norm = _normalize_country_or_market(r.get('country_name'))
-    by_name_b2b_acquity[cn_norm].append(r)
-
-by_name_b2c_acquity = defaultdict(list)
-for r in raw_b2c_acquity:
-    cn_norm = _normalize_country_or_market(r.get('country_name'))
-    by_name_b2c_acquity[cn_norm].append(r)
-
-
-# Build by_name dict with normalized keys (so 'US', 'United States', etc. all map to 'USA')
-by_name = defaultdict(list)
-for r in raw_b2b:
-    cn_raw = (r.get('country_name') or "")
-    cn_norm = _normalize_country_or_market(cn_raw)
-    by_name[cn_norm].append(r)
+    s = _clean_country_or_market(name)
+    return SYNONYM_TO_CANONICAL.get(s, s)  # fallback (unchanged if no match)
 
-# ---------------- Helpers ----------------
-def _parse_range(val):
+# ---------------- Pricing snapshot ----------------
+def _group_by_country(rows):
+    # normalized keys, so 'US', 'United States', etc. all map to 'USA'
+    grouped = defaultdict(list)
+    for r in rows:
+        grouped[_normalize_country_or_market(r.get('country_name') or "")].append(r)
+    return grouped
+
+class PricingSnapshot:
     """
-    Parse a value that may be a single number or a range:
-      - Handles 'ir- 5-9%', '5–9%', '5—9%', '5 to 9', '5 - 9', '8.5-12.2'
-      - Returns (min_int, max_int) with ceil for decimals
+    Every pricing table of one artifact bundle, fully indexed.
+    Built off the request path and never mutated once published.
     """
-    if val is None:
-        return None
-    s = str(val).lower().strip()
 
-    # Normalize unicode dashes to '-'
-    s = s.replace("–", "-").replace("—", "-")
-    # Remove percent signs and common labels like 'ir', 'loi', 'minutes', 'mins', etc. (only for parsing)
-    s_clean = re.sub(r"(percent|%|ir|loi|minutes|minute|mins|min)", "", s)
-    s_clean = s_clean.replace("to", "-")  # convert "5 to 9" to "5-9"
-    # Keep only digits, dot, dash and spaces
-    s_clean = re.sub(r"[^0-9\.\-\s]", " ", s_clean)
-    s_clean = re.sub(r"\s+", " ", s_clean).strip()
+    def __init__(self, artifacts):
+        self.version = None
+        self.complete = True
+
+        # ---- consumer ----
+        # RandomForest flattened to arrays (see forest.py); same predictions, no sklearn import
+        forest = artifacts.get("consumer_forest")
+        self.consumer_model = ForestModel(forest) if forest is not None else None
+        self.consumer_features = artifacts.get("consumer_features") or []
+        self.consumer_lookup = artifacts.get("consumer_lookup") or {}
+        buckets = artifacts.get("consumer_buckets") or {}
+        self.ir_buckets = buckets.get('ir_buckets', [])
+        self.loi_buckets = buckets.get('loi_buckets', [])
+
+        # Encodes model inputs straight into a NumPy row in consumer_features order
+        self.consumer_encoder = ConsumerFeatureEncoder(self.consumer_features)
+
+        # Dense exact/nearest price grid per market (built by train_consumer); absent => scan fallback
+        self.consumer_grid = artifacts.get("consumer_grid")
+        if self.consumer_grid:
+            self.consumer_grid["ir_pos"] = {v: i for i, v in enumerate(self.consumer_grid["ir_buckets"])}
+            self.consumer_grid["loi_pos"] = {v: i for i, v in enumerate(self.consumer_grid["loi_buckets"])}
+
+        # consumer_model predictions baked over the integer IR/LOI domain; live model only outside it
+        self.consumer_model_table = artifacts.get("consumer_model_table")
+        if self.consumer_model_table:
+            self.consumer_model_table["market_pos"] = {m: i for i, m in enumerate(self.consumer_model_table["markets"])}
+
+        # ---- B2B / Acuity / client rate cards ----
+        self.b2b_index = build_band_indexes(_group_by_country(artifacts.get("b2b_lookup") or []))
+        self.acuity_b2b_index = build_band_indexes(_group_by_country(artifacts.get("acuity_b2b_lookup") or []))
+        self.acuity_b2c_index = build_band_indexes(_group_by_country(artifacts.get("acuity_b2c_lookup") or []))
+        self.clients = ClientIndex(artifacts.get("b2b_client_lookup") or [])
+
+
+pricing_registry = ArtifactRegistry(ARTIFACT_ROOT, PricingSnapshot, default_files=ARTIFACT_FILES,
+                                    mmap_names=MMAP_ARTIFACTS, stages=[LOOKUP_ARTIFACTS])
+pricing_registry.start()
 
-    nums = re.findall(r"\d+\.?\d*", s_clean)
-    if "-" in s_clean and len(nums) >= 2:
+# ---------------- Helpers ----------------
+# Common shapes in one match: optional 'ir'/'loi' label, number, optional unit,
+# optionally a dash/'to' and a second number with unit ('ir- 5-9%', '10 to 15 mins', '20')
+_RANGE_UNIT = r"(?:%|percent|min(?:ute)?s?)?"
+_RANGE_FAST = re.compile(
+    r"\s*(?:ir|loi)?[\s:-]*([0-9]+(?:\.[0-9]*)?)\s*" + _RANGE_UNIT +
+    r"(?:\s*(?:-|to)\s*([0-9]+(?:\.[0-9]*)?)\s*" + _RANGE_UNIT + r")?\s*"
+)
+_RANGE_LABELS = re.compile(r"(percent|%|ir|loi|minutes|minute|mins|min)")
+_RANGE_NUMBER = re.compile(r"[0-9]+\.?[0-9]*")
+_RANGE_DASHES = str.maketrans({"–": "-", "—": "-"})
+
+def _range_from_numbers(nums, has_dash):
+    if has_dash and len(nums) >= 2:
         a = float(nums[0]); b = float(nums[1])
         lo = int(ceil(min(a, b)))
         hi = int(ceil(max(a, b)))
@@ -170,56 +217,67 @@ def _parse_range(val):
         return (iv, iv)
     return None
 
+@lru_cache(maxsize=4096)
+def _parse_range_text(text):
+    # Normalize unicode dashes to '-'
+    s = text.lower().translate(_RANGE_DASHES)
+
+    m = _RANGE_FAST.fullmatch(s)
+    if m:
+        lo, hi = m.groups()
+        return _range_from_numbers([lo, hi] if hi else [lo], hi is not None)
+
+    # Anything else: remove percent signs and labels like 'ir', 'loi', 'minutes', 'mins', etc.,
+    # then read the numbers (other characters only ever separate numbers)
+    s_clean = _RANGE_LABELS.sub("", s)
+    s_clean = s_clean.replace("to", "-")  # convert "5 to 9" to "5-9"
+    return _range_from_numbers(_RANGE_NUMBER.findall(s_clean), "-" in s_clean)
+
+def _parse_range(val):
+    """
+    Parse a value that may be a single number or a range:
+      - Handles 'ir- 5-9%', '5–9%', '5—9%', '5 to 9', '5 - 9', '8.5-12.2'
+      - Returns (min_int, max_int) with ceil for decimals
+    """
+    if val is None:
+        return None
+    return _parse_range_text(str(val))
+
 def parse_loi(val):
     return _parse_range(val)
 
 def parse_ir(val):
     return _parse_range(val)
 
-def rows_for_country(country_upper: str):
+def rows_for_country(country_upper: str, snap):
     cu = _normalize_country_or_market(country_upper)
-    if cu in by_name:  # exact (normalized) match
-        return by_name[cu], 'by_name'
-    if "INTERNATIONAL" in by_name:  # fallback
-        return by_name["INTERNATIONAL"], 'international'
-    return [], 'none'
-
-def cover_match(rows, loi_range, ir_range):
-    Lmin, Lmax = loi_range
-    Imin, Imax = ir_range
-    for r in rows:
-        if r['loi_min'] <= Lmin and Lmax <= r['loi_max'] and \
-           r['incidence_min'] <= Imin and Imax <= r['incidence_max']:
-            return r
-    return None
-
-def nearest_match(rows, loi_range, ir_range):
-    Lmid = (loi_range[0] + loi_range[1]) / 2
-    Imid = (ir_range[0] + ir_range[1]) / 2
-    best, best_d = None, None
-    for r in rows:
-        d_loi = abs(Lmid - (r['loi_min'] + r['loi_max'])/2)
-        d_ir  = abs(Imid - (r['incidence_min'] + r['incidence_max'])/2)
-        d = d_loi + d_ir
-        if best is None or d < best_d:
-            best, best_d = r, d
-    return best
-
-def b2b_find_price(country_upper, ir_input, loi_input):
-    rows, matched_type = rows_for_country(country_upper)
-    if not rows:
+    if cu in snap.b2b_index:  # exact (normalized) match
+        return snap.b2b_index[cu], 'by_name'
+    if "INTERNATIONAL" in snap.b2b_index:  # fallback
+        return snap.b2b_index["INTERNATIONAL"], 'international'
+    return None, 'none'
+
+def b2b_find_price(country_upper, ir_input, loi_input, snap=None):
+    snap = snap or pricing_registry.snapshot()
+    index, matched_type = rows_for_country(country_upper, snap)
+    if not index:
         return None, "no_rows", {"matched_type": matched_type}
 
-    parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
+    with stage("parse"):
+        parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
     if not parsed_loi or not parsed_ir:
         return None, "invalid_input", {"matched_type": matched_type}
 
-    r = cover_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("lookup"):
+        pos = index.cover(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "cover", {"row": r, "matched_type": matched_type}
 
-    r = nearest_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("nearest"):
+        pos = index.nearest(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "nearest", {"row": r, "matched_type": matched_type}
 
     return None, "no_match", {"matched_type": matched_type}
@@ -240,7 +298,7 @@ def map_to_next_bucket(value, bucket_list):
     idx = bisect.bisect_left(bucket_list, value)
     return bucket_list[min(idx, len(bucket_list)-1)]
 
-def nearest_lookup_price_for_market(market, ir, loi):
+def nearest_lookup_price_for_market(market, ir, loi, consumer_lookup):
     candidates = []
     for (mkt, ir_k, loi_k), price in consumer_lookup.items():
         if mkt != market:
@@ -253,72 +311,151 @@ def nearest_lookup_price_for_market(market, ir, loi):
     _, price, matched_ir, matched_loi = candidates[0]
     return float(price), matched_ir, matched_loi
 
-
-def load_acuity_b2b_rows():
-    try:
-        return joblib.load("ml/acuity_b2b_pricing_lookup.pkl")
-    except FileNotFoundError:
-        return []
-
-
-def acuity_b2b_find_price(country_upper, ir_input, loi_input):
-    rows = load_acuity_b2b_rows()
-    rows = [r for r in rows if r['country_name'] == country_upper.upper()]
+def consumer_grid_lookup(market, ir, loi, snap):
+    """
+    Exact-or-nearest consumer price from the precomputed grid.
+    Returns (price, matched_ir, matched_loi, exact), or None if the grid can't answer.
+    """
+    consumer_grid = snap.consumer_grid
+    if not consumer_grid:
+        return None
+    cells = consumer_grid["markets"].get(market)
+    i = consumer_grid["ir_pos"].get(ir)
+    j = consumer_grid["loi_pos"].get(loi)
+    if cells is None or i is None or j is None:
+        return None
+    return (float(cells["price"][i, j]), int(cells["matched_ir"][i, j]),
+            int(cells["matched_loi"][i, j]), bool(cells["exact"][i, j]))
+
+def consumer_grid_lookup_batch(markets, irs, lois, snap):
+    """consumer_grid_lookup for many inputs, one array gather per market."""
+    hits = [None] * len(markets)
+    consumer_grid = snap.consumer_grid
+    if not consumer_grid:
+        return hits
+    ir_pos = [consumer_grid["ir_pos"].get(v) for v in irs]
+    loi_pos = [consumer_grid["loi_pos"].get(v) for v in lois]
+    for market, cells in consumer_grid["markets"].items():
+        sel = [k for k, m in enumerate(markets) if m == market and ir_pos[k] is not None and loi_pos[k] is not None]
+        if not sel:
+            continue
+        i = np.array([ir_pos[k] for k in sel])
+        j = np.array([loi_pos[k] for k in sel])
+        for k, *hit in zip(sel, cells["price"][i, j].tolist(), cells["matched_ir"][i, j].tolist(),
+                           cells["matched_loi"][i, j].tolist(), cells["exact"][i, j].tolist()):
+            hits[k] = tuple(hit)
+    return hits
+
+def consumer_scan_lookup(market, ir, loi, snap):
+    """Same answer as consumer_grid_lookup, computed from consumer_lookup (no grid artifact)."""
+    key = (market, ir, loi)
+    if key in snap.consumer_lookup:
+        return float(snap.consumer_lookup[key]), ir, loi, True
+    price, matched_ir, matched_loi = nearest_lookup_price_for_market(market, ir, loi, snap.consumer_lookup)
+    if price is None:
+        return None
+    return price, matched_ir, matched_loi, False
+
+
+def consumer_model_predict(market, ir, loi, snap):
+    """consumer_model price for one input: baked table when in domain, else the live model."""
+    consumer_model_table = snap.consumer_model_table
+    if consumer_model_table:
+        m = consumer_model_table["market_pos"].get(market)
+        i = ir - consumer_model_table["ir_min"] if isinstance(ir, Integral) else -1
+        j = loi - consumer_model_table["loi_min"] if isinstance(loi, Integral) else -1
+        prices = consumer_model_table["prices"]
+        if m is not None and 0 <= i < prices.shape[1] and 0 <= j < prices.shape[2]:
+            return float(prices[m, i, j])
+
+    return float(snap.consumer_model.predict(snap.consumer_encoder.encode(market, ir, loi))[0])
+
+def consumer_model_predict_batch(markets, irs, lois, snap):
+    """consumer_model_predict for many inputs: one table gather, one live predict for the rest."""
+    prices = [None] * len(markets)
+    live = list(range(len(markets)))
+    consumer_model_table = snap.consumer_model_table
+    if consumer_model_table:
+        table = consumer_model_table["prices"]
+        m = np.array([consumer_model_table["market_pos"].get(v, -1) for v in markets])
+        i = np.array([v - consumer_model_table["ir_min"] if isinstance(v, Integral) else -1 for v in irs])
+        j = np.array([v - consumer_model_table["loi_min"] if isinstance(v, Integral) else -1 for v in lois])
+        ok = (m >= 0) & (i >= 0) & (i < table.shape[1]) & (j >= 0) & (j < table.shape[2])
+        for k, price in zip(np.flatnonzero(ok).tolist(), table[m[ok], i[ok], j[ok]].tolist()):
+            prices[k] = price
+        live = np.flatnonzero(~ok).tolist()
+
+    if live:
+        X = snap.consumer_encoder.encode_batch([markets[k] for k in live], [irs[k] for k in live], [lois[k] for k in live])
+        for k, price in zip(live, snap.consumer_model.predict(X).tolist()):
+            prices[k] = price
+    return prices
+
+
+
+def acuity_b2b_find_price(country_upper, ir_input, loi_input, snap=None):
+    snap = snap or pricing_registry.snapshot()
+    index = snap.acuity_b2b_index.get(_normalize_country_or_market(country_upper))
     matched_type = "acuity_b2b"
 
-    if not rows:
+    if not index:
         return None, "no_rows", {"matched_type": matched_type}
 
-    parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
+    with stage("parse"):
+        parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
     if parsed_loi is None or parsed_ir is None:
         return None, "invalid_input", {"matched_type": matched_type}
 
-    r = cover_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("lookup"):
+        pos = index.cover(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "cover", {"row": r, "matched_type": matched_type}
 
-    r = nearest_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("nearest"):
+        pos = index.nearest(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "nearest", {"row": r, "matched_type": matched_type}
 
     return None, "no_match", {"matched_type": matched_type}
 
 
-def load_acuity_b2c_rows():
-    try:
-        return joblib.load("ml/acuity_b2c_pricing_lookup.pkl")
-    except FileNotFoundError:
-        return []
 
-def acuity_b2c_find_price(country_upper, ir_input, loi_input):
-    rows = load_acuity_b2c_rows()
-    rows = [r for r in rows if r['country_name'] == country_upper.upper()]
+def acuity_b2c_find_price(country_upper, ir_input, loi_input, snap=None):
+    snap = snap or pricing_registry.snapshot()
+    index = snap.acuity_b2c_index.get(_normalize_country_or_market(country_upper))
     matched_type = "acuity_b2b"
 
-    if not rows:
+    if not index:
         return None, "no_rows", {"matched_type": matched_type}
 
-    parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
+    with stage("parse"):
+        parsed_loi, parsed_ir = parse_loi(loi_input), parse_ir(ir_input)
     if parsed_loi is None or parsed_ir is None:
         return None, "invalid_input", {"matched_type": matched_type}
 
-    r = cover_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("lookup"):
+        pos = index.cover(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "cover", {"row": r, "matched_type": matched_type}
 
-    r = nearest_match(rows, parsed_loi, parsed_ir)
-    if r:
+    with stage("nearest"):
+        pos = index.nearest(parsed_loi, parsed_ir)
+    if pos is not None:
+        r = index.row(pos)
         return r['price'], "nearest", {"row": r, "matched_type": matched_type}
 
     return None, "no_match", {"matched_type": matched_type}
 
 
-def b2b_with_client_find_price(client_name, dir="no", clevel="no"):
-    # load lookup
-    records = joblib.load("ml/b2b_with_client_pricing_lookup.pkl")
-
-    client_name = str(client_name).lower().strip()
-    matched = next((r for r in records if r["client_name"] == client_name), None)
+def b2b_with_client_find_price(client_name, dir="no", clevel="no", snap=None):
+    snap = snap or pricing_registry.snapshot()
+    client_name = normalize_client_name(client_name)
+    max_typos = min(CLIENT_NAME_MAX_TYPOS, len(client_name) // 4)
+    with stage("lookup"):
+        matched = snap.clients.get(client_name, max_typos=max_typos)
 
     if not matched:
         return None, {"message": f"No pricing found for client {client_name}"}
@@ -334,6 +471,7 @@ def b2b_with_client_find_price(client_name, dir="no", clevel="no"):
 
     return price, {
         "client_name": client_name,
+        "matched_client": matched["client_name"],
         "base_cpi": matched["min_cpi"],
         "dir": dir,
         "clevel": clevel,
@@ -375,184 +513,628 @@ def b2b_with_client_find_price(client_name, dir="no", clevel="no"):
 #     }
 
 
+REGION_KEYWORDS = ["MENA", "APAC", "EU", "USA", "CANADA", "UK", "LATAM"]
+
+def _build_region_matcher():
+    """
+    One regex over every region keyword, country code and country name, plus
+    literal -> (priority, region). Priority follows find_region's search order:
+    keywords first, then countries in dictionary order (code and name alike).
+    """
+    literals = [(kw, kw) for kw in REGION_KEYWORDS]
+    for code, data in countries.items():
+        literals.append((code, data["region"]))
+        literals.append((data["name"].upper(), data["region"]))
+
+    priority = {}
+    for rank, (literal, region) in enumerate(literals):
+        region = "LATAM America" if region == "LATAM" else region
+        priority.setdefault(literal, (rank, region))
+
+    # alternation in priority order inside a lookahead: every start position
+    # reports its best literal, overlapping candidates included
+    ordered = sorted(priority, key=lambda lit: priority[lit][0])
+    pattern = re.compile(r"(?=(" + "|".join(r"\b" + re.escape(lit) + r"\b" for lit in ordered) + r"))")
+    return pattern, priority
+
+_REGION_PATTERN, _REGION_PRIORITY = _build_region_matcher()
+
 def find_region(text: str) -> str:
     """
     Detects the region based on country code, country name, or region keyword.
     Special rule: LATAM -> LATAM America
     """
-    text_upper = text.upper()
+    best = None
+    for m in _REGION_PATTERN.finditer(text.upper()):
+        hit = _REGION_PRIORITY[m.group(1)]
+        if best is None or hit < best:
+            best = hit
+            if best[0] == 0:
+                break
+    return best[1] if best else "Unknown"
 
-    # Direct region keywords
-    for keyword in ["MENA", "APAC", "EU", "USA", "CANADA", "UK", "LATAM"]:
-        if re.search(r'\b' + re.escape(keyword) + r'\b', text_upper):
-            return "LATAM America" if keyword == "LATAM" else keyword
 
-    # Search by country code or country name
-    for code, data in countries.items():
-        country_name_upper = data["name"].upper()
-        if re.search(r'\b' + re.escape(code) + r'\b', text_upper) or re.search(r'\b' + re.escape(country_name_upper) + r'\b', text_upper):
-            region = data["region"]
-            return "LATAM America" if region == "LATAM" else region
 
-    return "Unknown"
+# =========================
+# Pricing service
+# =========================
+MAX_BATCH_QUOTES = 500
+
+def quote_path(data):
+    """Pricing path for one quote: acuity_b2b, acuity_b2c, clientwise, b2b or consumer."""
+    business_type = str(data.get("business_type", "")).lower().strip()
+    client_name = data.get("client_name")
+
+    if business_type == "b2b" and client_name == "acuity":
+        return "acuity_b2b"
+    if business_type == "b2c" and client_name == "acuity":
+        return "acuity_b2c"
+    if business_type == "b2b" and client_name and client_name.lower() != "acuity":
+        return "clientwise"
+    if business_type == "b2b":
+        return "b2b"
+    return "consumer"
+
+
+def _price_acuity(data, snap, kind):
+    with stage("normalize"):
+        country_name = _normalize_country_or_market(str(data.get("market", "")))
+    with stage("region"):
+        country = find_region(country_name)
+
+    ir_in, loi_in = data.get("ir"), data.get("loi")
+    if not country or ir_in is None or loi_in is None:
+        return {"status": "error", "message": "country, ir, loi required"}, 400
+
+    find_price = acuity_b2b_find_price if kind == "b2b" else acuity_b2c_find_price
+    price, source, meta = find_price(country, ir_in, loi_in, snap)
+    if price is not None:
+        return {
+            "status": "success",
+            "predicted_price": round(float(price), 2),
+            "source": f"{kind}_acquity_{source}",
+            "matched_type": meta.get("matched_type"),
+            "matched_row": meta.get("row")
+        }, 200
+    return {"status": "error", "message": f"No matching {kind.upper()} Acuity rule found", "source": f"{kind}_acquity_{source}", "meta": meta}, 404
+
+
+def _price_clientwise(data, snap):
+    dir_flag = data.get("dir")
+    clevel_flag = data.get("clevel")
+
+    price, meta = b2b_with_client_find_price(data.get("client_name"), dir_flag, clevel_flag, snap)
+    if price is not None:
+        return {
+            "status": "success",
+            "predicted_price": round(float(price), 2),
+            "source": "b2b_clientwise",
+            "meta": meta
+        }, 200
+    return {"status": "error", "message": meta["message"], "source": "b2b_clientwise"}, 404
+
+
+def _price_b2b(data, snap):
+    with stage("normalize"):
+        country = _normalize_country_or_market(str(data.get("market", "")))
+
+    ir_in, loi_in = data.get("ir"), data.get("loi")
+    if not country or ir_in is None or loi_in is None:
+        return {"status": "error", "message": "country, ir, loi required"}, 400
+
+    price, source, meta = b2b_find_price(country, ir_in, loi_in, snap)
+    if price is not None:
+        return {
+            "status": "success",
+            "predicted_price": round(float(price), 2),
+            "source": f"b2b_{source}",
+            "matched_type": meta.get("matched_type"),
+            "matched_row": meta.get("row")
+        }, 200
+    return {"status": "error", "message": "No matching B2B rule found", "source": f"b2b_{source}", "meta": meta}, 404
+
+
+def _consumer_inputs(data, snap):
+    """Returns ((market, mapped_ir, mapped_loi), None), or (None, error result)."""
+    if snap.consumer_model is None and not snap.consumer_lookup:
+        return None, ({"status": "error", "message": "Consumer model not trained"}, 400)
+
+    # Normalize market with USA synonyms; everything else => INTERNATIONAL
+    with stage("normalize"):
+        market_in = _normalize_country_or_market(str(data.get("market", "")))
+    market = "USA" if market_in == "USA" else "INTERNATIONAL"
+
+    # Robust IR/LOI parsing (accept ranges like 'ir- 5-9%')
+    with stage("parse"):
+        ir_range = parse_ir(data.get("ir"))
+        loi_range = parse_loi(data.get("loi"))
+    if not ir_range or not loi_range:
+        return None, ({"status": "error", "message": "market, ir, loi required"}, 400)
+
+    # Use UPPER bound for pricing conservatism before bucketing
+    with stage("bucket"):
+        mapped_ir = map_to_next_bucket(ir_range[1], snap.ir_buckets)
+        mapped_loi = map_to_next_bucket(loi_range[1], snap.loi_buckets)
+    return (market, mapped_ir, mapped_loi), None
+
+
+def _consumer_lookup_result(market, mapped_ir, mapped_loi, hit):
+    price, matched_ir, matched_loi, exact = hit
+    if exact:
+        return {
+            "status": "success",
+            "predicted_price": round(price, 2),
+            "source": "consumer_exact_lookup",
+            "market_used": market,
+            "mapped_ir": mapped_ir,
+            "mapped_loi": mapped_loi
+        }, 200
+
+    return {
+        "status": "success",
+        "predicted_price": round(price, 2),
+        "source": "consumer_nearest_lookup",
+        "market_used": market,
+        "mapped_ir": mapped_ir,
+        "mapped_loi": mapped_loi,
+        "matched_bucket_ir": matched_ir,
+        "matched_bucket_loi": matched_loi
+    }, 200
+
+
+def _consumer_model_result(market, mapped_ir, mapped_loi, predicted_price):
+    return {
+        "status": "success",
+        "predicted_price": round(float(predicted_price), 2),
+        "source": "consumer_model",
+        "market_used": market,
+        "mapped_ir": mapped_ir,
+        "mapped_loi": mapped_loi
+    }, 200
+
+
+def _model_unavailable(snap):
+    if not snap.complete:
+        error = pricing_registry.failed()
+        if error:
+            return {"status": "error", "message": f"Pricing model failed to load: {error}"}, 503
+        return {"status": "error", "message": "Pricing model is still loading"}, 503
+    return {"status": "error", "message": "No lookup match and model unavailable"}, 400
+
+def _price_consumer(data, snap):
+    inputs, error = _consumer_inputs(data, snap)
+    if error:
+        return error
+    market, mapped_ir, mapped_loi = inputs
+
+    # 1) Exact lookup, else 2) nearest lookup for that market (one grid cell)
+    with stage("lookup"):
+        hit = consumer_grid_lookup(market, mapped_ir, mapped_loi, snap)
+    if hit is None:
+        with stage("nearest"):
+            hit = consumer_scan_lookup(market, mapped_ir, mapped_loi, snap)
+    if hit is not None:
+        return _consumer_lookup_result(market, mapped_ir, mapped_loi, hit)
+
+    # 3) Fallback to model
+    if snap.consumer_model is None:
+        return _model_unavailable(snap)
+
+    with stage("model"):
+        predicted_price = consumer_model_predict(market, mapped_ir, mapped_loi, snap)
+    return _consumer_model_result(market, mapped_ir, mapped_loi, predicted_price)
+
+
+# Successful quote results keyed on snapshot version + canonical inputs; emptied on every swap
+quote_cache = TTLCache(maxsize=PRICE_CACHE_SIZE, ttl=PRICE_CACHE_TTL)
+pricing_registry.listeners.append(lambda snap: quote_cache.clear())
+
+
+def quote_cache_key(path, data, snap):
+    """Canonical key for a quote's result, or None if it can't be cached."""
+    if path == "clientwise":
+        key = (snap.version, path, normalize_client_name(data.get("client_name")), data.get("dir"), data.get("clevel"))
+    else:
+        market = _normalize_country_or_market(str(data.get("market", "")))
+        if path in ("acuity_b2b", "acuity_b2c"):
+            market = find_region(market)
+        elif path == "consumer":
+            market = "USA" if market == "USA" else "INTERNATIONAL"
+        key = (snap.version, path, market, parse_ir(data.get("ir")), parse_loi(data.get("loi")))
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+PRICERS = {
+    "acuity_b2b": lambda data, snap: _price_acuity(data, snap, "b2b"),
+    "acuity_b2c": lambda data, snap: _price_acuity(data, snap, "b2c"),
+    "clientwise": _price_clientwise,
+    "b2b": _price_b2b,
+    "consumer": _price_consumer,
+}
+
+
+ARTIFACTS_LOADING = {"status": "error", "message": "Pricing artifacts are still loading"}
+
+
+def artifacts_unavailable():
+    """503 body for a worker without a snapshot: still loading, or the load failed (with its error)."""
+    error = pricing_registry.failed()
+    if error:
+        return {"status": "error", "message": f"Pricing artifacts failed to load: {error}"}
+    return dict(ARTIFACTS_LOADING)
+
+
+def price_quote(data, snap=None):
+    """
+    Price one quote request against one pricing snapshot (the live one by default).
+    Returns (payload, http_status); successes are cached.
+    """
+    try:
+        snap = snap or pricing_registry.snapshot(wait=PRICING_LOAD_WAIT)
+        if snap is None:
+            return artifacts_unavailable(), 503
+        path = quote_path(data)
+        with stage("cache"):
+            key = quote_cache_key(path, data, snap) if quote_cache.maxsize > 0 else None
+            cached = quote_cache.get(key) if key is not None else None
+        if cached is not None:
+            mark("cache_hit")
+            return dict(cached), 200
+
+        payload, status_code = PRICERS[path](data, snap)
+        if key is not None and status_code == 200:
+            quote_cache.set(key, payload)
+        return payload, status_code
+    except Exception as e:
+        return {"status": "error", "message": str(e)}, 400
+
+
+def _price_consumer_batch(items, positions, results, snap):
+    """Consumer half of price_quotes: grid cells and model prices resolved as arrays."""
+    pending = []
+    for pos in positions:
+        try:
+            inputs, error = _consumer_inputs(items[pos], snap)
+        except Exception as e:
+            inputs, error = None, ({"status": "error", "message": str(e)}, 400)
+        if error:
+            results[pos] = error
+        else:
+            pending.append((pos, *inputs))
+    if not pending:
+        return
+
+    # 1) + 2) exact / nearest lookup
+    hits = consumer_grid_lookup_batch([p[1] for p in pending], [p[2] for p in pending], [p[3] for p in pending], snap)
+    missed = []
+    for (pos, market, mapped_ir, mapped_loi), hit in zip(pending, hits):
+        if hit is None:
+            hit = consumer_scan_lookup(market, mapped_ir, mapped_loi, snap)
+        if hit is not None:
+            results[pos] = _consumer_lookup_result(market, mapped_ir, mapped_loi, hit)
+        else:
+            missed.append((pos, market, mapped_ir, mapped_loi))
+    if not missed:
+        return
+
+    # 3) model, one predict call for the whole group
+    if snap.consumer_model is None:
+        for pos, *_ in missed:
+            results[pos] = _model_unavailable(snap)
+        return
+    try:
+        prices = consumer_model_predict_batch([m[1] for m in missed], [m[2] for m in missed], [m[3] for m in missed], snap)
+    except Exception as e:
+        for pos, *_ in missed:
+            results[pos] = {"status": "error", "message": str(e)}, 400
+        return
+    for (pos, market, mapped_ir, mapped_loi), price in zip(missed, prices):
+        results[pos] = _consumer_model_result(market, mapped_ir, mapped_loi, price)
+
 
+def price_quotes(items):
+    """
+    Price many quotes; returns [(payload, http_status)] in input order.
+    Quotes are grouped by pricing path; a failing quote only fails its own entry.
+    """
+    snap = pricing_registry.snapshot(wait=PRICING_LOAD_WAIT)
+    if snap is None:
+        return [(artifacts_unavailable(), 503) for _ in items]
+    results = [None] * len(items)
+    groups = defaultdict(list)
+    for pos, data in enumerate(items):
+        if not isinstance(data, dict):
+            results[pos] = {"status": "error", "message": "quote must be an object"}, 400
+            continue
+        try:
+            groups[quote_path(data)].append(pos)
+        except Exception as e:
+            results[pos] = {"status": "error", "message": str(e)}, 400
+
+    for path, positions in groups.items():
+        if path == "consumer":
+            _price_consumer_batch(items, positions, results, snap)
+            continue
+        # B2B / Acuity / client paths are index probes per quote
+        for pos in positions:
+            results[pos] = price_quote(items[pos], snap)
+    return results
+
+
+# =========================
+# IR x LOI price sweep
+# =========================
+MAX_SWEEP_CELLS = 5000
+SWEEP_SOURCES = ["exact", "nearest", "cover", "model"]
+SWEEP_EXACT, SWEEP_NEAREST, SWEEP_COVER, SWEEP_MODEL = range(len(SWEEP_SOURCES))
+
+
+def _sweep_axis(data, name):
+    """
+    Values {name}_min..{name}_max (inclusive) every {name}_step (default 1),
+    with each value parsed like a single quote's ir/loi: (values, ranges).
+    """
+    lo, hi = data.get(f"{name}_min"), data.get(f"{name}_max")
+    if lo is None or hi is None:
+        raise ValueError(f"{name}_min and {name}_max required")
+    lo, hi, step = float(lo), float(hi), float(data.get(f"{name}_step", 1))
+    if lo < 0 or hi < lo or step <= 0:
+        raise ValueError(f"{name} sweep needs 0 <= {name}_min <= {name}_max and {name}_step > 0")
+    count = int((hi - lo) / step + 1e-9) + 1
+    if count > MAX_SWEEP_CELLS:
+        raise ValueError(f"at most {MAX_SWEEP_CELLS} cells per sweep")
+    values = [lo + k * step for k in range(count)]
+    values = [int(v) if v.is_integer() else v for v in values]
+    return values, [_parse_range(v) for v in values]
+
+
+def _sweep_consumer(data, snap, ir_ranges, loi_ranges):
+    """Returns ((meta, prices, sources), None), or (None, error result)."""
+    market_in = _normalize_country_or_market(str(data.get("market", "")))
+    market = "USA" if market_in == "USA" else "INTERNATIONAL"
+    # Upper bound of each range, bucketed, exactly as for a single quote
+    mapped_ir = [map_to_next_bucket(r[1], snap.ir_buckets) for r in ir_ranges]
+    mapped_loi = [map_to_next_bucket(r[1], snap.loi_buckets) for r in loi_ranges]
+
+    # 1) + 2) exact / nearest: one grid gather, scan only where the grid can't answer
+    cells = [(i, j) for i in range(len(mapped_ir)) for j in range(len(mapped_loi))]
+    hits = consumer_grid_lookup_batch([market] * len(cells), [mapped_ir[i] for i, _ in cells],
+                                      [mapped_loi[j] for _, j in cells], snap)
+    prices = np.zeros((len(mapped_ir), len(mapped_loi)))
+    sources = np.zeros(prices.shape, dtype=np.int8)
+    missed = []
+    for (i, j), hit in zip(cells, hits):
+        if hit is None:
+            hit = consumer_scan_lookup(market, mapped_ir[i], mapped_loi[j], snap)
+        if hit is None:
+            missed.append((i, j))
+            continue
+        prices[i, j] = hit[0]
+        sources[i, j] = SWEEP_EXACT if hit[3] else SWEEP_NEAREST
+
+    # 3) model for the rest, one batched predict
+    if missed:
+        if snap.consumer_model is None:
+            return None, _model_unavailable(snap)
+        predicted = consumer_model_predict_batch([market] * len(missed), [mapped_ir[i] for i, _ in missed],
+                                                 [mapped_loi[j] for _, j in missed], snap)
+        for (i, j), price in zip(missed, predicted):
+            prices[i, j] = price
+            sources[i, j] = SWEEP_MODEL
+
+    meta = {"market_used": market, "mapped_ir": mapped_ir, "mapped_loi": mapped_loi}
+    return (meta, prices, sources), None
+
+
+def _sweep_rate_card(data, snap, path, ir_ranges, loi_ranges):
+    """B2B / Acuity: one band-index sweep. Returns ((meta, prices, sources), None), or (None, error result)."""
+    country = _normalize_country_or_market(str(data.get("market", "")))
+    if path == "b2b":
+        index, matched_type = rows_for_country(country, snap) if country else (None, "none")
+        meta = {"market_used": country, "matched_type": matched_type}
+        not_found = "No matching B2B rule found"
+    else:
+        kind = path[len("acuity_"):]
+        country = find_region(country)
+        indexes = snap.acuity_b2b_index if kind == "b2b" else snap.acuity_b2c_index
+        index = indexes.get(_normalize_country_or_market(country)) if country else None
+        meta = {"market_used": country, "matched_type": "acuity_b2b"}
+        not_found = f"No matching {kind.upper()} Acuity rule found"
+    if not country:
+        return None, ({"status": "error", "message": "country, ir, loi required"}, 400)
+    if not index:
+        return None, ({"status": "error", "message": not_found, "meta": meta}, 404)
+
+    positions, covered = index.sweep(loi_ranges, ir_ranges)
+    sources = np.where(covered, SWEEP_COVER, SWEEP_NEAREST).astype(np.int8)
+    return (meta, index.price[positions], sources), None
+
+
+def price_sweep(data):
+    """
+    Price one quote across an IR x LOI grid. Returns (payload, http_status);
+    prices[i][j] is the price /predict-cpi/ gives for ir[i], loi[j].
+    """
+    try:
+        snap = pricing_registry.snapshot(wait=PRICING_LOAD_WAIT)
+        if snap is None:
+            return artifacts_unavailable(), 503
+        path = quote_path(data)
+        if path == "clientwise":
+            return {"status": "error", "message": "client-specific pricing does not depend on IR/LOI"}, 400
+        ir_values, ir_ranges = _sweep_axis(data, "ir")
+        loi_values, loi_ranges = _sweep_axis(data, "loi")
+        if len(ir_values) * len(loi_values) > MAX_SWEEP_CELLS:
+            return {"status": "error", "message": f"at most {MAX_SWEEP_CELLS} cells per sweep"}, 400
+
+        if path == "consumer":
+            result, error = _sweep_consumer(data, snap, ir_ranges, loi_ranges)
+        else:
+            result, error = _sweep_rate_card(data, snap, path, ir_ranges, loi_ranges)
+        if error:
+            return error
+        meta, prices, sources = result
+        return {
+            "status": "success",
+            "path": path,
+            **meta,
+            "ir": ir_values,
+            "loi": loi_values,
+            "prices": [[round(p, 2) for p in row] for row in prices.tolist()],
+            "sources": sources.tolist(),
+            "source_codes": SWEEP_SOURCES,
+        }, 200
+    except Exception as e:
+        return {"status": "error", "message": str(e)}, 400
 
 
 # =========================
 # DRF View
 # =========================
+# Per-path, per-stage latency of /predict-cpi/ (see timing.py)
+stage_latency = LatencyHistograms()
+
+TIMING_PATHS = {
+    "consumer_exact_lookup": "consumer_exact",
+    "consumer_nearest_lookup": "consumer_nearest",
+    "consumer_model": "consumer_model",
+    "b2b_cover": "b2b_cover",
+    "b2b_nearest": "b2b_nearest",
+    "b2b_clientwise": "clientwise",
+}
+
+
+def timing_path(payload, status_code):
+    """Histogram label for a priced quote: consumer_exact, b2b_cover, acuity, ... or error."""
+    if status_code != 200:
+        return "error"
+    source = payload.get("source", "")
+    if "_acquity_" in source:
+        return "acuity"
+    return TIMING_PATHS.get(source, "other")
+
+
+def _lru_counts(fn):
+    info = fn.cache_info()
+    return info.hits, info.misses, info.currsize
+
+
+def pricing_metrics():
+    """/metrics samples kept elsewhere: live artifact bundle and cache counters of this process."""
+    report = pricing_registry.status()
+    samples = [("gauge", "predictcpi_artifact_ready", {}, int(report["ready"]))]
+    if report["version"] is not None:
+        samples.append(("gauge", "predictcpi_artifact_info", {"version": report["version"]}, 1))
+    if report["load_seconds"] is not None:
+        samples.append(("gauge", "predictcpi_artifact_load_seconds", {}, report["load_seconds"]))
+    if report["loaded_at"] is not None:
+        samples.append(("gauge", "predictcpi_artifact_loaded_timestamp_seconds", {}, report["loaded_at"]))
+    for name, seconds in pricing_registry.artifact_seconds.items():
+        samples.append(("gauge", "predictcpi_artifact_file_load_seconds", {"artifact": name}, seconds))
+
+    caches = {
+        "quote": (quote_cache.hits, quote_cache.misses, len(quote_cache)),
+        "market_name": _lru_counts(_normalize_country_or_market),
+        "range_text": _lru_counts(_parse_range_text),
+    }
+    for cache, (hits, misses, size) in caches.items():
+        samples.append(("counter", "predictcpi_cache_hits_total", {"cache": cache}, hits))
+        samples.append(("counter", "predictcpi_cache_misses_total", {"cache": cache}, misses))
+        samples.append(("gauge", "predictcpi_cache_entries", {"cache": cache}, size))
+    return samples
+
+
+metrics.collectors.append(pricing_metrics)
+metrics.ratio("predictcpi_cache_hit_ratio", "predictcpi_cache_hits_total", "predictcpi_cache_misses_total",
+              "Cache hits / lookups, all workers.")
+metrics.describe("predictcpi_quotes_total", "Priced quotes by endpoint and pricing source.")
+metrics.describe("predictcpi_quote_seconds", "Single-quote pricing latency by pricing source.")
+metrics.describe("predictcpi_artifact_info", "Pricing bundle version loaded by each worker.")
+metrics.describe("predictcpi_artifact_ready", "1 once this worker has a complete pricing bundle loaded.")
+metrics.describe("predictcpi_artifact_load_seconds", "Time the last pricing bundle load took.")
+metrics.describe("predictcpi_artifact_loaded_timestamp_seconds", "Unix time the live pricing bundle was loaded.")
+metrics.describe("predictcpi_artifact_file_load_seconds", "Load time of each file in the live pricing bundle.")
+metrics.describe("predictcpi_cache_hits_total", "Cache hits by cache, per worker.")
+metrics.describe("predictcpi_cache_misses_total", "Cache misses by cache, per worker.")
+metrics.describe("predictcpi_cache_entries", "Entries held by each pricing cache.")
+
+
 class PredictCPI(APIView):
     def post(self, request):
-        try:
-            business_type = str(request.data.get("business_type", "")).lower().strip()
-            client_name=request.data.get("client_name")
-
-            # -------- B2B ACUITY CASE --------
-            if business_type == "b2b" and client_name == "acuity":
-                country_name = _normalize_country_or_market(str(request.data.get("market", "")))
-                country=find_region(country_name)
-
-                ir_in, loi_in = request.data.get("ir"), request.data.get("loi")
-                if not country or ir_in is None or loi_in is None:
-                    return Response({"status": "error", "message": "country, ir, loi required"}, status=400)
-
-                price, source, meta = acuity_b2b_find_price(country, ir_in, loi_in)
-
-                if price is not None:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(float(price), 2),
-                        "source": f"b2b_acquity_{source}",
-                        "matched_type": meta.get("matched_type"),
-                        "matched_row": meta.get("row")
-                    })
-                return Response({"status": "error", "message": "No matching B2B Acuity rule found", "source": f"b2b_acquity_{source}", "meta": meta}, status=404)
-
-    # -------- B2C ACUITY CASE --------
-            elif business_type == "b2c" and client_name == "acuity":
-                country_name = _normalize_country_or_market(str(request.data.get("market", "")))
-                country=find_region(country_name)
-
-                ir_in, loi_in = request.data.get("ir"), request.data.get("loi")
-                if not country or ir_in is None or loi_in is None:
-                    return Response({"status": "error", "message": "country, ir, loi required"}, status=400)
-
-                price, source, meta = acuity_b2c_find_price(country, ir_in, loi_in)
-                if price is not None:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(float(price), 2),
-                        "source": f"b2c_acquity_{source}",
-                        "matched_type": meta.get("matched_type"),
-                        "matched_row": meta.get("row")
-                    })
-                return Response({"status": "error", "message": "No matching B2C Acuity rule found", "source": f"b2c_acquity_{source}", "meta": meta}, status=404)
-
-            elif business_type == "b2b" and client_name and client_name.lower() != "acuity":
-                dir_flag = request.data.get("dir")
-                clevel_flag = request.data.get("clevel")
-                
-                price, meta = b2b_with_client_find_price(client_name, dir_flag, clevel_flag)
-
-                if price is not None:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(float(price), 2),
-                        "source": "b2b_clientwise",
-                        "meta": meta
-                    })
-                return Response({"status": "error", "message": meta["message"], "source": "b2b_clientwise"}, status=404)
-                        # -------- B2B CASE --------
-            elif business_type == "b2b":
-
-                country = _normalize_country_or_market(str(request.data.get("market", "")))
-                print("*******withoutb2bClientcou",country)
-
-                ir_in, loi_in = request.data.get("ir"), request.data.get("loi")
-                if not country or ir_in is None or loi_in is None:
-                    return Response({"status": "error", "message": "country, ir, loi required"}, status=400)
-
-                price, source, meta = b2b_find_price(country, ir_in, loi_in)
-                if price is not None:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(float(price), 2),
-                        "source": f"b2b_{source}",
-                        "matched_type": meta.get("matched_type"),
-                        "matched_row": meta.get("row")
-                    })
-                return Response({"status": "error", "message": "No matching B2B rule found", "source": f"b2b_{source}", "meta": meta}, status=404)
-
-            # -------- CONSUMER CASE --------
-            else:
-                if consumer_model is None and not consumer_lookup:
-                    return Response({"status": "error", "message": "Consumer model not trained"}, status=400)
-
-                # Normalize market with USA synonyms; everything else => INTERNATIONAL
-                market_in = _normalize_country_or_market(str(request.data.get("market", "")))
-                market = "USA" if market_in == "USA" else "INTERNATIONAL"
-
-                # Robust IR/LOI parsing (accept ranges like 'ir- 5-9%')
-                ir_range = parse_ir(request.data.get("ir"))
-                loi_range = parse_loi(request.data.get("loi"))
-                if not ir_range or not loi_range:
-                    return Response({"status": "error", "message": "market, ir, loi required"}, status=400)
-
-                # Use UPPER bound for pricing conservatism before bucketing
-                ir_val = ir_range[1]
-                loi_val = loi_range[1]
-
-                mapped_ir = map_to_next_bucket(ir_val, ir_buckets)
-                mapped_loi = map_to_next_bucket(loi_val, loi_buckets)
-
-                # 1) Exact lookup
-                key = (market, mapped_ir, mapped_loi)
-                if key in consumer_lookup:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(float(consumer_lookup[key]), 2),
-                        "source": "consumer_exact_lookup",
-                        "market_used": market,
-                        "mapped_ir": mapped_ir,
-                        "mapped_loi": mapped_loi
-                    })
-
-                # 2) Nearest lookup for that market
-                price_nearest, matched_ir, matched_loi = nearest_lookup_price_for_market(market, mapped_ir, mapped_loi)
-                if price_nearest is not None:
-                    return Response({
-                        "status": "success",
-                        "predicted_price": round(price_nearest, 2),
-                        "source": "consumer_nearest_lookup",
-                        "market_used": market,
-                        "mapped_ir": mapped_ir,
-                        "mapped_loi": mapped_loi,
-                        "matched_bucket_ir": matched_ir,
-                        "matched_bucket_loi": matched_loi
-                    })
-
-                # 3) Fallback to model
-                if consumer_model is None:
-                    return Response({"status": "error", "message": "No lookup match and model unavailable"}, status=400)
-
-                input_market_df = pd.get_dummies(pd.Series([market]), prefix='market')
-                input_numeric_df = pd.DataFrame([{'incidence_rate': mapped_ir, 'loi_minutes': mapped_loi}])
-                input_encoded = pd.concat(
-                    [input_market_df.reset_index(drop=True), input_numeric_df.reset_index(drop=True)],
-                    axis=1
-                ).reindex(columns=consumer_features, fill_value=0)
-
-                predicted_price = consumer_model.predict(input_encoded)[0]
-                return Response({
-                    "status": "success",
-                    "predicted_price": round(float(predicted_price), 2),
-                    "source": "consumer_model",
-                    "market_used": market,
-                    "mapped_ir": mapped_ir,
-                    "mapped_loi": mapped_loi
-                })
+        start = time.perf_counter()
+        with request_timer(PRICE_STAGE_TIMING) as timer:
+            payload, status_code = price_quote(request.data)
+        source = timing_path(payload, status_code)
+        metrics.observe("predictcpi_quote_seconds", time.perf_counter() - start, source=source)
+        metrics.inc("predictcpi_quotes_total", endpoint="single", source=source)
+        response = Response(payload, status=status_code)
+        if timer is not None:
+            response["Server-Timing"] = timer.server_timing()
+            # cache hits get their own histograms, not those of the path that priced them first
+            stage_latency.observe("cache_hit" if "cache_hit" in timer.marks else source, timer)
+        return response
+
+
+class PredictCPIBatch(APIView):
+    """
+    Price many quotes in one request: {"quotes": [{...}, ...]} (or a bare list).
+    Each result carries its input index and its own status_code.
+    """
+    def post(self, request):
+        quotes = request.data.get("quotes") if isinstance(request.data, dict) else request.data
+        if not isinstance(quotes, list) or not quotes:
+            return Response({"status": "error", "message": "quotes list required"}, status=400)
+        if len(quotes) > MAX_BATCH_QUOTES:
+            return Response({"status": "error", "message": f"at most {MAX_BATCH_QUOTES} quotes per request"}, status=400)
+
+        results = price_quotes(quotes)
+        for payload, status_code in results:
+            metrics.inc("predictcpi_quotes_total", endpoint="batch", source=timing_path(payload, status_code))
+        return Response({
+            "status": "success",
+            "count": len(results),
+            "results": [
+                {"index": pos, "status_code": status_code, **payload}
+                for pos, (payload, status_code) in enumerate(results)
+            ]
+        })
+
+
+class PredictCPISweep(APIView):
+    """
+    Price matrix over IR x LOI for one market/business type:
+    {"business_type", "market", "client_name"?, "ir_min", "ir_max", "ir_step"?, "loi_min", "loi_max", "loi_step"?}.
+    prices/sources are rows per IR value, columns per LOI value; sources index into source_codes.
+    """
+    def post(self, request):
+        payload, status_code = price_sweep(request.data)
+        return Response(payload, status=status_code)
+
+
+class PriceCacheStats(APIView):
+    def get(self, request):
+        return Response(quote_cache.stats())
+
+
+class PriceTimingStats(APIView):
+    def get(self, request):
+        return Response(stage_latency.snapshot())
+
+
+class ReadyZ(APIView):
+    """Load balancer readiness: 200 once every pricing artifact is warm, else 503."""
+
+    def get(self, request):
+        report = pricing_registry.status()
+        return Response(report, status=200 if report["ready"] else 503)
 
-        except Exception as e:
-            return Response({"status": "error", "message": str(e)}, status=400)
 
+class Metrics(APIView):
+    """Prometheus text format, merged over every worker process (see metrics.py)."""
 
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type=CONTENT_TYPE)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'predictcpi.settings')
 
 application = get_wsgi_application()
+
+# Import the URLconf (and so the views) at boot instead of on the first request:
+# pricing artifacts start loading in the background right away, and with
+# `gunicorn --preload` the master finishes that load before forking workers.
+import predictcpi.urls  # noqa: E402,F401